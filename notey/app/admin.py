@@ -1,9 +1,23 @@
 from django.contrib import admin
 
-from .models import Profile, Project, ProjectUser, Note, Attachment
+from .models import (
+    ApiToken,
+    Profile,
+    Project,
+    ProjectSnapshot,
+    ProjectUser,
+    Note,
+    Attachment,
+    Blob,
+    Upload,
+)
 
 admin.site.register(Profile)
 admin.site.register(Project)
 admin.site.register(ProjectUser)
 admin.site.register(Note)
 admin.site.register(Attachment)
+admin.site.register(Upload)
+admin.site.register(Blob)
+admin.site.register(ProjectSnapshot)
+admin.site.register(ApiToken)
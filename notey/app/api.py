@@ -0,0 +1,203 @@
+import json
+from functools import wraps
+
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_http_methods, require_POST
+
+from .decorators import get_project_user
+from .models import ApiToken, Note, Project, ProjectUser, api_token_digest
+
+MAX_BULK_NOTES = 1000
+NOTES_PER_PAGE = 200
+NOTE_FIELDS = ("id", "text", "user_id", "is_completed")
+
+
+def api_response(data, status=200):
+    return JsonResponse(
+        data, status=status, json_dumps_params={"separators": (",", ":")}
+    )
+
+
+def api_error(message, status=400):
+    return api_response({"error": message}, status=status)
+
+
+def authenticate(request):
+    scheme, _, key = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not key:
+        return None
+    token = (
+        ApiToken.objects.select_related("user")
+        .filter(digest=api_token_digest(key.strip()))
+        .first()
+    )
+    if token is None or not token.user.is_active:
+        return None
+    return token.user
+
+
+def api_view(view):
+    """
+    Authenticates API requests by a bearer token instead of the session, so
+    they need no CSRF token, and resolves request.project and
+    request.project_user for views of a project. Failures are JSON errors.
+    """
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        user = authenticate(request)
+        if user is None:
+            response = api_error("Authentication required.", status=401)
+            response.headers["WWW-Authenticate"] = "Bearer"
+            return response
+        request.user = user
+        if "project_id" in kwargs:
+            try:
+                project_user = get_project_user(user, kwargs["project_id"])
+            except ProjectUser.DoesNotExist:
+                return api_error("Project not found.", status=404)
+            request.project_user = project_user
+            request.project = project_user.project
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def read_json(request):
+    try:
+        return json.loads(request.body)
+    except ValueError:
+        return None
+
+
+def read_note_ids(request):
+    data = read_json(request)
+    if not isinstance(data, dict):
+        return None, data
+    ids = data.get("ids")
+    if (
+        not isinstance(ids, list)
+        or len(ids) > MAX_BULK_NOTES
+        or not all(isinstance(note_id, int) for note_id in ids)
+    ):
+        return None, data
+    return ids, data
+
+
+@api_view
+@require_GET
+def projects(request):
+    projects = (
+        Project.objects.for_user(request.user)
+        .order_by("name")
+        .values("id", "name", "is_archived", "note_count", "open_note_count")
+    )
+    return api_response({"projects": list(projects)})
+
+
+@api_view
+@require_GET
+def members(request, project_id):
+    members = request.project.get_users().values(
+        "user_id", "user__username", "permission"
+    )
+    return api_response(
+        {
+            "members": [
+                {
+                    "user_id": member["user_id"],
+                    "username": member["user__username"],
+                    "permission": member["permission"],
+                }
+                for member in members
+            ]
+        }
+    )
+
+
+@api_view
+@require_http_methods(["GET", "POST"])
+def notes(request, project_id):
+    if request.method == "POST":
+        return create_notes(request)
+
+    before = request.GET.get("before")
+    before = int(before) if before and before.isdigit() else None
+    notes = list(
+        request.project.get_notes()
+        .feed(before=before)
+        .values(*NOTE_FIELDS)[: NOTES_PER_PAGE + 1]
+    )
+    next_cursor = None
+    if len(notes) > NOTES_PER_PAGE:
+        notes = notes[:NOTES_PER_PAGE]
+        next_cursor = notes[-1]["id"]
+    return api_response({"notes": notes, "next": next_cursor})
+
+
+def create_notes(request):
+    if not request.project_user.can_write:
+        return api_error("Writing notes is not permitted.", status=403)
+    if request.project.is_archived:
+        return api_error("The project is archived.", status=403)
+
+    data = read_json(request)
+    items = data.get("notes") if isinstance(data, dict) else None
+    if not isinstance(items, list) or not 0 < len(items) <= MAX_BULK_NOTES:
+        return api_error(f"Expected 1 to {MAX_BULK_NOTES} notes.")
+
+    max_length = Note._meta.get_field("text").max_length
+    notes = []
+    for index, item in enumerate(items):
+        text = item.get("text") if isinstance(item, dict) else None
+        if not isinstance(text, str) or not 0 < len(text) <= max_length:
+            return api_error(f"Note {index} needs a text of 1 to {max_length} chars.")
+        is_completed = item.get("is_completed", False)
+        if not isinstance(is_completed, bool):
+            return api_error(f"Note {index} needs a boolean is_completed.")
+        if is_completed and not request.project_user.can_complete:
+            return api_error("Completing notes is not permitted.", status=403)
+        notes.append(
+            Note(
+                text=text,
+                user=request.user,
+                project=request.project,
+                is_completed=is_completed,
+            )
+        )
+
+    notes = Note.objects.create_in_bulk(notes)
+    return api_response({"ids": [note.id for note in notes]}, status=201)
+
+
+@api_view
+@require_POST
+def complete_notes(request, project_id):
+    if not request.project_user.can_complete:
+        return api_error("Completing notes is not permitted.", status=403)
+
+    ids, data = read_note_ids(request)
+    if ids is None:
+        return api_error(f"Expected a list of at most {MAX_BULK_NOTES} note ids.")
+
+    completed = data.get("is_completed", True)
+    if not isinstance(completed, bool):
+        return api_error("Expected a boolean is_completed.")
+    updated = request.project.get_notes().filter(id__in=ids).set_completed(completed)
+    return api_response({"updated": updated})
+
+
+@api_view
+@require_POST
+def delete_notes(request, project_id):
+    if not request.project_user.can_delete:
+        return api_error("Deleting notes is not permitted.", status=403)
+
+    ids, data = read_note_ids(request)
+    if ids is None:
+        return api_error(f"Expected a list of at most {MAX_BULK_NOTES} note ids.")
+
+    deleted = request.project.get_notes().filter(id__in=ids).delete_in_bulk()
+    return api_response({"deleted": deleted})
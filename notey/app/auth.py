@@ -0,0 +1,31 @@
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+USER_CACHE_TIMEOUT = 60
+
+
+def user_cache_key(user_id):
+    return f"user:{user_id}"
+
+
+def invalidate_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    The model backend, loading the user of each request, with their profile,
+    from the cache.
+    """
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            try:
+                user = User.objects.select_related("profile").get(pk=user_id)
+            except User.DoesNotExist:
+                return None
+            cache.set(key, user, USER_CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,33 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite, for several worker processes sharing one database file. Besides
+    the options of sqlite3.connect(), OPTIONS may hold "pragmas", set on every
+    new connection, and "transaction_mode", how transactions begin: DEFERRED
+    (SQLite's default), IMMEDIATE or EXCLUSIVE.
+    """
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop("pragmas", None)
+        params.pop("transaction_mode", None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.settings_dict["OPTIONS"].get("pragmas", {}).items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        # A deferred transaction that reads before it writes has to upgrade its
+        # lock, which fails at once with "database is locked" when another
+        # connection is writing, whatever the busy timeout. Taking the write
+        # lock at BEGIN makes writers wait for each other instead.
+        mode = self.settings_dict["OPTIONS"].get("transaction_mode")
+        if mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute(f"BEGIN {mode}")
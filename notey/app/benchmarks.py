@@ -0,0 +1,250 @@
+import copy
+import json
+import statistics
+import time
+import tracemalloc
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern, reverse
+
+from . import search
+from .models import (
+    ApiToken,
+    Attachment,
+    Blob,
+    Note,
+    Profile,
+    Project,
+    ProjectSnapshot,
+    ProjectUser,
+    ProjectUserPermission,
+    Upload,
+)
+from .urls import app_name, urlpatterns
+
+BENCHMARK_USERNAME = "benchmark"
+LOCAL_CACHE = "django.core.cache.backends.locmem.LocMemCache"
+
+# Requests that need more than a GET without data. Each returns the method and
+# the data to send, given the seeded objects.
+ROUTE_REQUESTS = {
+    "search": lambda seed: ("get", {"q": "note"}),
+    "new_project": lambda seed: ("post", {"name": "Benchmark project"}),
+    "new_note": lambda seed: ("post", {"text": "Benchmark note"}),
+    "bulk_notes": lambda seed: (
+        "post",
+        {"action": "complete", "note": seed["note_ids"]},
+    ),
+    "new_upload": lambda seed: ("post", {"filename": "upload.txt", "size": 1024}),
+    "api_complete_notes": lambda seed: ("json", {"ids": seed["note_ids"]}),
+    "api_delete_notes": lambda seed: ("json", {"ids": seed["note_ids"]}),
+}
+
+
+class Rollback(Exception):
+    pass
+
+
+def seed_dataset(users, projects, notes, attachments):
+    """
+    Creates users x projects memberships, notes per project and attachments
+    per note, all sharing one blob. The benchmark user is a member of every
+    project. Returns the objects routes are resolved against.
+    """
+    people = User.objects.bulk_create(
+        [User(username=BENCHMARK_USERNAME)]
+        + [User(username=f"{BENCHMARK_USERNAME}{i}") for i in range(1, users)]
+    )
+    Profile.objects.bulk_create([Profile(user=user) for user in people])
+    user = people[0]
+
+    created = Project.objects.bulk_create(
+        [
+            Project(creator=user, name=f"Project {i}", is_archived=i == projects - 1)
+            for i in range(projects)
+        ]
+    )
+    ProjectUser.objects.bulk_create(
+        [
+            ProjectUser(
+                project=project,
+                user=person,
+                permission=ProjectUserPermission.DELETE,
+            )
+            for project in created
+            for person in people
+        ]
+    )
+    Note.objects.create_in_bulk(
+        [
+            Note(
+                text=f"Note {i} of {project.name}",
+                user=people[i % len(people)],
+                project=project,
+                is_completed=i % 2 == 0,
+            )
+            for project in created
+            for i in range(notes)
+        ]
+    )
+
+    blob = Blob.objects.store(ContentFile(b"Benchmark attachment"), "attachment.txt")
+    note_ids = list(Note.objects.values_list("id", flat=True))
+    Attachment.objects.bulk_create(
+        [
+            Attachment(note_id=note_id, blob=blob, name=f"attachment{i}.txt")
+            for note_id in note_ids
+            for i in range(attachments)
+        ]
+    )
+    Blob.objects.filter(pk=blob.pk).update(ref_count=len(note_ids) * attachments)
+    Project.objects.update(attachment_count=F("note_count") * attachments)
+    search.rebuild_index()
+    ProjectSnapshot.objects.compact(created[-1])
+
+    project = created[0]
+    return {
+        "user": user,
+        "project": project,
+        "archived_project": created[-1],
+        "note_ids": list(project.get_notes().values_list("id", flat=True)[:50]),
+        "attachment": Attachment.objects.filter(note__project=project).first(),
+        "member": people[-1],
+        "upload": Upload.objects.create(
+            user=user, project=project, filename="upload.txt", size=1024
+        ),
+    }
+
+
+def route_kwargs(name, pattern, seed):
+    project = seed["project"]
+    if name in ("archive_project_details", "unarchive_project"):
+        project = seed["archived_project"]
+    values = {
+        "project_id": project.id,
+        "note_id": seed["note_ids"][0],
+        "attachment_id": seed["attachment"].id,
+        "upload_id": seed["upload"].id,
+        "name": project.image.name,
+        "user_id": seed["member"].id,
+    }
+    return {key: values[key] for key in pattern.pattern.converters}
+
+
+def send(client, url, method, data):
+    if method == "json":
+        response = client.post(url, json.dumps(data), content_type="application/json")
+    else:
+        response = getattr(client, method)(url, data)
+    if response.streaming:
+        b"".join(response.streaming_content)
+    response.close()
+    return response
+
+
+def measure(client, url, method, data, repeat):
+    """
+    Requests url repeat times after a warm-up request, each inside a
+    transaction that is rolled back, so routes that change data measure the
+    same dataset every time.
+    """
+
+    # Restore the session cookie before each request, in case one logged out.
+    cookies = copy.copy(client.cookies)
+
+    def request():
+        client.cookies = copy.copy(cookies)
+        try:
+            with transaction.atomic():
+                response = send(client, url, method, data)
+                raise Rollback
+        except Rollback:
+            return response
+
+    response = request()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        request()
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    with CaptureQueriesContext(connection) as queries:
+        request()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    client.cookies = cookies
+
+    return {
+        "status": response.status_code,
+        "time_ms": round(statistics.median(timings) * 1000, 2),
+        "queries": len(queries),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def isolated_caches():
+    """
+    Settings giving every cache alias an empty store of its own in this
+    process. Throwaway databases reuse the ids of real objects, so their
+    entries must never reach, or clear, the deployment's cache.
+    """
+    location = f"isolated-{uuid.uuid4()}"
+    return override_settings(
+        CACHES={
+            alias: {"BACKEND": LOCAL_CACHE, "LOCATION": f"{location}-{alias}"}
+            for alias in settings.CACHES
+        }
+    )
+
+
+def run_benchmarks(seed, repeat=5):
+    # The session serves the pages, the token the API.
+    _, key = ApiToken.objects.create_for(seed["user"])
+    client = Client(HTTP_AUTHORIZATION=f"Bearer {key}")
+    client.force_login(seed["user"])
+    results = {}
+    for pattern in urlpatterns:
+        if not isinstance(pattern, URLPattern):
+            continue
+        url = reverse(
+            f"{app_name}:{pattern.name}",
+            kwargs=route_kwargs(pattern.name, pattern, seed),
+        )
+        method, data = "get", {}
+        if pattern.name in ROUTE_REQUESTS:
+            method, data = ROUTE_REQUESTS[pattern.name](seed)
+        results[pattern.name] = measure(client, url, method, data, repeat)
+    return results
+
+
+def find_regressions(results, baseline, threshold, slack_ms=1.0):
+    """
+    Compares results with a baseline run. A view regresses when it runs more
+    queries, or when its time or peak memory grows by more than threshold
+    (time also by more than slack_ms, to ignore noise in fast views).
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["queries"] > base["queries"]:
+            regressions.append(
+                f"{name}: {base['queries']} -> {result['queries']} queries"
+            )
+        if (
+            result["time_ms"] > base["time_ms"] * (1 + threshold)
+            and result["time_ms"] - base["time_ms"] > slack_ms
+        ):
+            regressions.append(f"{name}: {base['time_ms']} -> {result['time_ms']} ms")
+        if result["peak_kb"] > base["peak_kb"] * (1 + threshold):
+            regressions.append(f"{name}: {base['peak_kb']} -> {result['peak_kb']} KB")
+    return regressions
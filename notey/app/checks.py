@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+SHARED_CACHE_BACKENDS = (
+    "django.core.cache.backends.redis.",
+    "django.core.cache.backends.memcached.",
+    "django.core.cache.backends.db.",
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if settings.CACHES["default"]["BACKEND"].startswith(SHARED_CACHE_BACKENDS):
+        return []
+    return [
+        Warning(
+            "The default cache is not shared between worker processes.",
+            hint=(
+                "Set REDIS_URL, unless the app runs in a single process. "
+                "Logouts, password changes and revoked memberships otherwise "
+                "only reach the process that served them."
+            ),
+            id="app.W001",
+        )
+    ]
@@ -0,0 +1,152 @@
+import asyncio
+import hashlib
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import decorators
+from django.contrib.auth.views import redirect_to_login
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.http import Http404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .models import ProjectUser
+
+PROJECT_USER_CACHE_TIMEOUT = 300
+
+
+def project_user_cache_key(user_id, project_id):
+    return f"project_user:{user_id}:{project_id}"
+
+
+def project_users():
+    # Memberships are cached, so a lagging replica could keep a revoked one
+    # cached for PROJECT_USER_CACHE_TIMEOUT.
+    return ProjectUser.objects.using(DEFAULT_DB_ALIAS).select_related("project")
+
+
+def get_project_user(user, project_id):
+    key = project_user_cache_key(user.id, project_id)
+    project_user = cache.get(key)
+    if project_user is None:
+        project_user = project_users().get(user=user, project_id=project_id)
+        cache.set(key, project_user, PROJECT_USER_CACHE_TIMEOUT)
+    project_user.user = user
+    return project_user
+
+
+async def aget_project_user(user, project_id):
+    key = project_user_cache_key(user.id, project_id)
+    project_user = await cache.aget(key)
+    if project_user is None:
+        project_user = await project_users().aget(user=user, project_id=project_id)
+        await cache.aset(key, project_user, PROJECT_USER_CACHE_TIMEOUT)
+    project_user.user = user
+    return project_user
+
+
+def invalidate_project_users(project_id, user_ids):
+    keys = [project_user_cache_key(user_id, project_id) for user_id in user_ids]
+    cache.delete_many(keys)
+    # Until the change commits, other requests may cache the old membership.
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+async def is_authenticated(request):
+    # request.user loads the session and the user lazily, which may only
+    # happen outside of the event loop.
+    return await sync_to_async(lambda: request.user.is_authenticated)()
+
+
+def login_required(view):
+    """
+    Django's login_required, which also accepts async views.
+    """
+    if not asyncio.iscoroutinefunction(view):
+        return decorators.login_required(view)
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not await is_authenticated(request):
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def project_member_required(view):
+    """
+    Resolves the project and the caller's membership once per request and
+    exposes them as request.project and request.project_user.
+    """
+    if asyncio.iscoroutinefunction(view):
+        return async_project_member_required(view)
+
+    @login_required
+    @wraps(view)
+    def wrapper(request, project_id, *args, **kwargs):
+        try:
+            project_user = get_project_user(request.user, project_id)
+        except ProjectUser.DoesNotExist:
+            raise Http404("Project not found.")
+        request.project_user = project_user
+        request.project = project_user.project
+        return view(request, project_id, *args, **kwargs)
+
+    return wrapper
+
+
+def async_project_member_required(view):
+    @login_required
+    @wraps(view)
+    async def wrapper(request, project_id, *args, **kwargs):
+        try:
+            project_user = await aget_project_user(request.user, project_id)
+        except ProjectUser.DoesNotExist:
+            raise Http404("Project not found.")
+        request.project_user = project_user
+        request.project = project_user.project
+        return await view(request, project_id, *args, **kwargs)
+
+    return wrapper
+
+
+def page_etag(request, *parts):
+    # Pages show the user's name and embed a CSRF token tied to their cookie.
+    parts += (request.user.id, request.user.username, request.META.get("CSRF_COOKIE"))
+    return hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+
+
+def conditional_page(etag_func):
+    """
+    Answers conditional GETs of an async view with 304 Not Modified before
+    the view runs. etag_func returns the page's ETag and last modification
+    time, and should cost no more than an indexed lookup.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return await view(request, *args, **kwargs)
+
+            etag, last_modified = await etag_func(request, *args, **kwargs)
+            etag = quote_etag(etag)
+            last_modified = last_modified and int(last_modified.timestamp())
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response.headers["ETag"] = etag
+                if last_modified:
+                    response.headers["Last-Modified"] = http_date(last_modified)
+                # Pages are per user and must be revalidated on every view.
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,51 @@
+import asyncio
+import collections
+import contextlib
+import functools
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+class LocalBroker:
+    """
+    Fans note events out to the subscribers of this process. Deployments
+    serving one project from several processes need a broker shared between
+    them, e.g. one backed by Redis pub/sub, with the same two methods.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = collections.defaultdict(set)
+
+    def publish(self, project_id, event):
+        with self.lock:
+            subscribers = list(self.subscribers.get(project_id, ()))
+        for loop, queue in subscribers:
+            # Publishers run in request threads, subscribers in the event loop.
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, project_id):
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue())
+        with self.lock:
+            self.subscribers[project_id].add(subscriber)
+        try:
+            yield subscriber[1]
+        finally:
+            with self.lock:
+                self.subscribers[project_id].discard(subscriber)
+                if not self.subscribers[project_id]:
+                    del self.subscribers[project_id]
+
+
+@functools.lru_cache(maxsize=None)
+def get_broker():
+    return import_string(settings.NOTE_EVENT_BROKER)()
+
+
+def publish_note_event(project_id, event_type, note_ids):
+    event = {"type": event_type, "ids": list(note_ids)}
+    transaction.on_commit(lambda: get_broker().publish(project_id, event))
@@ -1,9 +1,11 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
+from django.db.models import Value
+from django.db.models.functions import Lower
 from django.forms import ModelForm, ValidationError
 
-from .models import Note, Profile, Project, ProjectUser
+from .models import Note, Profile, Project, ProjectUser, Upload
 
 
 class NewUserForm(UserCreationForm):
@@ -23,7 +25,11 @@ class NewUserForm(UserCreationForm):
     def clean_email(self):
         email = self.data["email"]
 
-        if User.objects.filter(email=email).exists():
+        if (
+            User.objects.alias(email_lower=Lower("email"))
+            .filter(email_lower=Lower(Value(email)))
+            .exists()
+        ):
             raise ValidationError("A user with that email already exists.")
 
         return email
@@ -48,6 +54,11 @@ class NewNoteForm(ModelForm):
         widget=forms.ClearableFileInput(attrs={"multiple": True}),
         required=False,
     )
+    upload = forms.ModelMultipleChoiceField(
+        queryset=Upload.objects.none(),
+        widget=forms.MultipleHiddenInput(),
+        required=False,
+    )
 
     class Meta:
         model = Note
@@ -55,6 +66,38 @@ class NewNoteForm(ModelForm):
         exclude = ["user", "project", "is_completed"]
 
 
+class NewUploadForm(ModelForm):
+    class Meta:
+        model = Upload
+        fields = ["filename", "size"]
+
+    def clean_size(self):
+        size = self.cleaned_data["size"]
+        if size == 0:
+            raise ValidationError("Empty files cannot be uploaded.")
+
+        return size
+
+
+class BulkNoteActionForm(forms.Form):
+    ACTIONS = [
+        ("complete", "Complete selected"),
+        ("reopen", "Reopen selected"),
+        ("delete", "Delete selected"),
+    ]
+
+    action = forms.ChoiceField(choices=ACTIONS)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        note_ids = self.data.getlist("note")
+        if not note_ids or not all(note_id.isdigit() for note_id in note_ids):
+            raise ValidationError("Select at least one note.")
+
+        cleaned_data["notes"] = [int(note_id) for note_id in note_ids]
+        return cleaned_data
+
+
 class NewProjectUser(ModelForm):
     class Meta:
         model = ProjectUser
@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """
+    PBKDF2 with PASSWORD_HASH_ITERATIONS iterations. Hashes made with another
+    count are rehashed the next time their user logs in.
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_ITERATIONS
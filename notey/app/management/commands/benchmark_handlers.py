@@ -0,0 +1,121 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, RequestFactory
+
+HOST = "localhost"
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares throughput and latency of the WSGI and ASGI handlers serving "
+        "the same page at a fixed concurrency. Requests are driven in-process, "
+        "so the numbers cover Django and the database but not a web server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Page to request, e.g. /projects.")
+        parser.add_argument("--username", required=True, help="User to log in as.")
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument("--concurrency", type=int, default=16)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']!r} does not exist.")
+        client = Client()
+        client.force_login(user)
+        cookie = f"{settings.SESSION_COOKIE_NAME}="
+        cookie += client.cookies[settings.SESSION_COOKIE_NAME].value
+
+        path, total = options["path"], options["requests"]
+        concurrency = options["concurrency"]
+        for name, run in (("wsgi", run_wsgi), ("asgi", run_asgi)):
+            # Warm up caches and connections before measuring.
+            run(path, cookie, concurrency, concurrency)
+            started = time.perf_counter()
+            latencies, errors = run(path, cookie, total, concurrency)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(format_result(name, latencies, errors, elapsed))
+
+
+def format_result(name, latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    return (
+        f"{name}: {len(latencies) / elapsed:.1f} req/s, "
+        f"p50 {p50:.1f} ms, p99 {p99:.1f} ms, {errors} error(s)"
+    )
+
+
+def run_wsgi(path, cookie, total, concurrency):
+    handler = WSGIHandler()
+    factory = RequestFactory(HTTP_COOKIE=cookie, SERVER_NAME=HOST)
+
+    def request(_):
+        environ = factory.get(path).environ
+        status = []
+        started = time.perf_counter()
+        body = handler(environ, lambda code, headers: status.append(code))
+        b"".join(body)
+        body.close()
+        return time.perf_counter() - started, not status[0].startswith("200")
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(request, range(total)))
+    return [latency for latency, _ in results], sum(error for _, error in results)
+
+
+def run_asgi(path, cookie, total, concurrency):
+    handler = ASGIHandler()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "headers": [(b"host", HOST.encode()), (b"cookie", cookie.encode())],
+        "client": ("127.0.0.1", 0),
+        "server": (HOST, 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def request():
+        status = []
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                status.append(message["status"])
+
+        started = time.perf_counter()
+        await handler(dict(scope), receive, send)
+        return time.perf_counter() - started, status[0] != 200
+
+    async def worker(count, results):
+        for _ in range(count):
+            results.append(await request())
+
+    async def run():
+        results = []
+        counts = [total // concurrency] * concurrency
+        for i in range(total % concurrency):
+            counts[i] += 1
+        await asyncio.gather(*(worker(count, results) for count in counts))
+        return results
+
+    results = asyncio.run(run())
+    return [latency for latency, _ in results], sum(error for _, error in results)
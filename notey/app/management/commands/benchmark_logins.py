@@ -0,0 +1,80 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import (
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+from django.urls import reverse
+
+from app.benchmarks import isolated_caches
+
+USERNAME = "benchmark"
+PASSWORD = "benchmark-password"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures logins per second through the login view on one core, for "
+        "each hasher iteration count given, against a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            action="append",
+            help="Iterations to measure. Repeatable; PASSWORD_HASH_ITERATIONS "
+            "if not given.",
+        )
+        parser.add_argument("--logins", type=int, default=20)
+
+    def handle(self, *args, **options):
+        counts = options["iterations"] or [settings.PASSWORD_HASH_ITERATIONS]
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(verbosity=0, serialize=False)
+        try:
+            with isolated_caches():
+                for count in counts:
+                    with override_settings(PASSWORD_HASH_ITERATIONS=count):
+                        timings, hash_time = measure_logins(options["logins"])
+                    self.stdout.write(format_result(count, timings, hash_time))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+
+def measure_logins(logins):
+    User.objects.filter(username=USERNAME).delete()
+    User.objects.create_user(USERNAME, password=PASSWORD)
+    hasher = get_hasher()
+    started = time.perf_counter()
+    hasher.encode(PASSWORD, hasher.salt())
+    hash_time = time.perf_counter() - started
+
+    url = reverse("app:login")
+    data = {"username": USERNAME, "password": PASSWORD}
+    timings = []
+    for _ in range(logins):
+        client = Client()
+        started = time.perf_counter()
+        response = client.post(url, data)
+        timings.append(time.perf_counter() - started)
+        if response.status_code != 302:
+            raise CommandError(f"Login failed with status {response.status_code}.")
+    return timings, hash_time
+
+
+def format_result(count, timings, hash_time):
+    median = statistics.median(timings)
+    return (
+        f"{count} iterations: {1 / median:.1f} logins/s per core, "
+        f"p50 {median * 1000:.1f} ms per login, {hash_time * 1000:.1f} ms hashing"
+    )
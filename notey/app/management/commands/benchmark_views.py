@@ -0,0 +1,104 @@
+import json
+import os
+import platform
+import shutil
+import tempfile
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+
+from app.benchmarks import (
+    find_regressions,
+    isolated_caches,
+    run_benchmarks,
+    seed_dataset,
+)
+from app.models import DEFAULT_PROJECT_IMAGE
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a throwaway test database and measures wall time, query count "
+        "and peak memory of every app route. Results can be saved as JSON and "
+        "compared against a baseline run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=5)
+        parser.add_argument("--projects", type=int, default=10)
+        parser.add_argument("--notes", type=int, default=200, help="Per project.")
+        parser.add_argument("--attachments", type=int, default=1, help="Per note.")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--output", help="File to save the results to.")
+        parser.add_argument("--baseline", help="Results to compare against.")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.2,
+            help="Relative growth in time or memory counted as a regression.",
+        )
+
+    def handle(self, *args, **options):
+        dataset = {
+            name: options[name]
+            for name in ("users", "projects", "notes", "attachments")
+        }
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as file:
+                baseline = json.load(file)
+            if baseline["dataset"] != dataset:
+                raise CommandError("The baseline was run on a different dataset.")
+
+        results = self.run(dataset, options["repeat"])
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:28} {result['status']:4} {result['time_ms']:9.2f} ms "
+                f"{result['queries']:4} queries {result['peak_kb']:9.1f} KB"
+            )
+
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                json.dump(
+                    {
+                        "dataset": dataset,
+                        "python": platform.python_version(),
+                        "django": django.get_version(),
+                        "views": results,
+                    },
+                    file,
+                    indent=2,
+                )
+
+        if baseline is not None:
+            regressions = find_regressions(
+                results, baseline["views"], options["threshold"]
+            )
+            if regressions:
+                raise CommandError("Regressions:\n" + "\n".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions."))
+
+    def run(self, dataset, repeat):
+        media_root = tempfile.mkdtemp()
+        default_image = os.path.join(settings.MEDIA_ROOT, DEFAULT_PROJECT_IMAGE)
+        if os.path.exists(default_image):
+            copy = os.path.join(media_root, DEFAULT_PROJECT_IMAGE)
+            os.makedirs(os.path.dirname(copy))
+            shutil.copy(default_image, copy)
+
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(verbosity=0, serialize=False)
+        try:
+            with override_settings(MEDIA_ROOT=media_root), isolated_caches():
+                return run_benchmarks(seed_dataset(**dataset), repeat)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(media_root)
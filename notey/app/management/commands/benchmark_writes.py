@@ -0,0 +1,131 @@
+import multiprocessing
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections, transaction
+from django.db.utils import load_backend
+
+from app.models import Note, Project
+
+ALIAS = "benchmark_writes"
+
+# Django's SQLite defaults, opening a connection per request, against the
+# configured profile.
+PROFILES = {
+    "default": lambda: {
+        "ENGINE": "django.db.backends.sqlite3",
+        "CONN_MAX_AGE": 0,
+        "OPTIONS": {},
+    },
+    "configured": lambda: {
+        key: settings.DATABASES["default"][key]
+        for key in ("ENGINE", "CONN_MAX_AGE", "OPTIONS")
+    },
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures concurrent note writes from several processes to one SQLite "
+        "file, with Django's default SQLite settings and with the configured "
+        "ones. Each transaction reads the project, adds a note and updates the "
+        "project's counters, like the new note view."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=4)
+        parser.add_argument(
+            "--transactions", type=int, default=200, help="Per process."
+        )
+
+    def handle(self, *args, **options):
+        for name, profile in PROFILES.items():
+            directory = tempfile.mkdtemp()
+            try:
+                database = {
+                    **connections["default"].settings_dict,
+                    **profile(),
+                    "NAME": os.path.join(directory, "db.sqlite3"),
+                }
+                latencies, failures, elapsed = run_profile(
+                    database, options["processes"], options["transactions"]
+                )
+            finally:
+                shutil.rmtree(directory)
+            self.stdout.write(format_result(name, latencies, failures, elapsed))
+
+
+def connect(database):
+    backend = load_backend(database["ENGINE"])
+    connections[ALIAS] = backend.DatabaseWrapper(database, ALIAS)
+    return connections[ALIAS]
+
+
+def run_profile(database, processes, transactions):
+    connection = connect(database)
+    # Only the tables the workload touches. The data migrations read from the
+    # default database, so migrate can't build this one.
+    with connection.schema_editor() as editor:
+        for model in (User, Project, Note):
+            editor.create_model(model)
+    # Bulk inserts skip the signals, which write to the default database.
+    [user] = User.objects.using(ALIAS).bulk_create([User(username="benchmark")])
+    [project] = Project.objects.using(ALIAS).bulk_create(
+        [Project(creator=user, name="Benchmark")]
+    )
+    connection.close()
+    # Forked workers must not share the parent's connections.
+    connections.close_all()
+
+    context = multiprocessing.get_context("fork")
+    started = time.perf_counter()
+    with context.Pool(processes) as pool:
+        results = pool.starmap(
+            write_notes,
+            [(database, user.id, project.id, transactions)] * processes,
+        )
+    elapsed = time.perf_counter() - started
+    latencies = [latency for result in results for latency in result[0]]
+    return latencies, sum(result[1] for result in results), elapsed
+
+
+def write_notes(database, user_id, project_id, transactions):
+    connection = connect(database)
+    latencies, failures = [], 0
+    for i in range(transactions):
+        started = time.perf_counter()
+        try:
+            with transaction.atomic(using=ALIAS):
+                project = Project.objects.using(ALIAS).get(pk=project_id)
+                Note.objects.using(ALIAS).bulk_create(
+                    [Note(text=f"Note {i}", user_id=user_id, project=project)]
+                )
+                Project.objects.using(ALIAS).filter(pk=project_id).adjust_counters(
+                    notes=1, open_notes=1
+                )
+        except OperationalError:
+            failures += 1
+        else:
+            latencies.append(time.perf_counter() - started)
+        # What the end of a request does.
+        connection.close_if_unusable_or_obsolete()
+    connection.close()
+    return latencies, failures
+
+
+def format_result(name, latencies, failures, elapsed):
+    if not latencies:
+        return f"{name}: all {failures} transaction(s) failed"
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    return (
+        f"{name}: {len(latencies) / elapsed:.1f} tx/s, "
+        f"p50 {p50:.1f} ms, p99 {p99:.1f} ms, {failures} failed"
+    )
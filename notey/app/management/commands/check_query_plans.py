@@ -0,0 +1,49 @@
+import re
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Value
+from django.db.models.functions import Lower
+
+from app.models import Attachment, Project, ProjectUser
+
+# SQLite reports reading a whole table (or a whole index) as "SCAN <table>",
+# and lookups through an index as "SEARCH <table> USING ...".
+FULL_SCAN = re.compile(r"\bSCAN (\w+)")
+
+
+def hot_queries():
+    user, project = User(id=1), Project(id=1)
+    return {
+        "active projects of a user": Project.objects.visible_to(user),
+        "archived projects of a user": Project.objects.visible_to(user, archived=True),
+        "membership of a user": ProjectUser.objects.filter(user=user, project=project),
+        "note feed page": project.get_notes().feed(before=1000)[:51],
+        "open notes of a project": project.get_notes().filter(is_completed=False),
+        "attachments of notes": Attachment.objects.filter(note_id__in=[1, 2, 3]),
+        "user by email": User.objects.alias(email_lower=Lower("email")).filter(
+            email_lower=Lower(Value("user@example.com"))
+        ),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs EXPLAIN QUERY PLAN on the hot queries and fails if any of them "
+        "scans a whole table."
+    )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("Query plans can only be checked on SQLite.")
+
+        scans = []
+        for name, queryset in hot_queries().items():
+            plan = queryset.explain()
+            self.stdout.write(f"{name}:\n{plan}")
+            scans += [f"{name}: SCAN {table}" for table in FULL_SCAN.findall(plan)]
+
+        if scans:
+            raise CommandError("Full scans in hot queries:\n" + "\n".join(scans))
+        self.stdout.write(self.style.SUCCESS("No full scans in hot queries."))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from app.models import Project, ProjectSnapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves the notes and attachments of archived projects without a "
+        "snapshot into one, as archiving a project now does."
+    )
+
+    def handle(self, *args, **options):
+        projects = Project.objects.archived().filter(snapshot__isnull=True)
+        count = 0
+        for project in projects.iterator():
+            ProjectSnapshot.objects.compact(project)
+            self.stdout.write(f"{project.name}: {project.note_count} note(s)")
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"{count} project(s) compacted."))
@@ -0,0 +1,22 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from app.models import ApiToken
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates a token for the JSON API and prints its key, which is sent as "
+        '"Authorization: Bearer <key>" and cannot be shown again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']} does not exist.")
+        token, key = ApiToken.objects.create_for(user)
+        self.stdout.write(f"Token {token.id}: {key}")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from app.models import Upload
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes uploads, with their partial files, that were neither written "
+        "to nor attached within Upload.EXPIRES_AFTER. Run it periodically."
+    )
+
+    def handle(self, *args, **options):
+        count, _ = Upload.objects.stale().delete()
+        self.stdout.write(self.style.SUCCESS(f"{count} upload(s) deleted."))
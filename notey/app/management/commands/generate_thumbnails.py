@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from app.models import Project
+from app.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = "Generates card thumbnails for existing project images."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Regenerate thumbnails that already exist.",
+        )
+
+    def handle(self, *args, **options):
+        generated = 0
+        seen = set()
+        for project in Project.objects.only("image").iterator():
+            image = project.image
+            if image.name in seen:
+                continue
+            seen.add(image.name)
+            try:
+                generate_thumbnails(image, force=options["force"])
+            except OSError as error:
+                self.stderr.write(f"{image.name}: {error}")
+                continue
+            generated += 1
+
+        self.stdout.write(self.style.SUCCESS(f"{generated} image(s) processed."))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from app.models import Project
+
+
+class Command(BaseCommand):
+    help = "Recomputes the note and attachment counters stored on each project."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report projects whose counters have drifted.",
+        )
+
+    def handle(self, *args, **options):
+        drifted = []
+        # Archived projects keep their notes in snapshots, so their counters
+        # can't be recomputed from the live tables.
+        projects = Project.objects.filter(snapshot__isnull=True)
+        for project in projects.with_actual_counters().iterator():
+            stored = [getattr(project, field) for field in Project.COUNTER_FIELDS]
+            actual = [
+                getattr(project, f"actual_{field}") for field in Project.COUNTER_FIELDS
+            ]
+            if stored == actual:
+                continue
+            self.stdout.write(f"{project.name}: {stored} -> {actual}")
+            for field, value in zip(Project.COUNTER_FIELDS, actual):
+                setattr(project, field, value)
+            drifted.append(project)
+
+        if drifted and not options["check"]:
+            Project.objects.bulk_update(drifted, Project.COUNTER_FIELDS)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"{len(drifted)} project(s) with drifted counters.")
+        )
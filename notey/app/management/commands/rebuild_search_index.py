@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app import search
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search index over notes and attachment names."
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError("Full-text search requires the SQLite backend.")
+
+        indexed = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"{indexed} note(s) indexed."))
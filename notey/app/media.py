@@ -0,0 +1,135 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+BLOCK_SIZE = 64 * 1024
+# Types browsers display without running scripts in the app's origin. Anything
+# else is downloaded, so an uploaded HTML or SVG file can't run as a page.
+INLINE_CONTENT_TYPES = {
+    "image/avif",
+    "image/gif",
+    "image/jpeg",
+    "image/png",
+    "image/webp",
+    "application/pdf",
+}
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def byte_range(request, etag, size):
+    """
+    Returns the inclusive (start, end) of a single requested byte range, or
+    None when the whole file should be sent.
+    """
+    header = request.headers.get("Range")
+    if_range = request.headers.get("If-Range")
+    if not header or (if_range and if_range != etag):
+        return None
+
+    # Multiple or malformed ranges fall back to the whole file.
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+
+    start, end = match.groups()
+    if not start:
+        length = int(end)
+        if length == 0:
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable
+    return start, end
+
+
+def read_range(path, start, end):
+    with open(path, "rb") as file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            block = file.read(min(BLOCK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+def serve_file(request, storage, name, etag=None, filename=None, immutable=False):
+    """
+    Serves a stored file with validators and range support, or hands the
+    transfer to the front server when MEDIA_SENDFILE_HEADER is set.
+    """
+    try:
+        path = storage.path(name)
+        stat = os.stat(path)
+    except (ValueError, FileNotFoundError):
+        raise Http404("File not found.")
+
+    etag = quote_etag(etag or f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+    last_modified = int(stat.st_mtime)
+    filename = filename or os.path.basename(name)
+    content_type = mimetypes.guess_type(filename)[0]
+    disposition = "inline"
+    if content_type not in INLINE_CONTENT_TYPES:
+        content_type, disposition = "application/octet-stream", "attachment"
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = build_file_response(request, name, path, etag, stat.st_size)
+        if response.status_code != 416:
+            response["Content-Type"] = content_type
+            response[
+                "Content-Disposition"
+            ] = f"{disposition}; filename*=UTF-8''{quote(filename)}"
+
+    response["X-Content-Type-Options"] = "nosniff"
+    response["Content-Security-Policy"] = "sandbox"
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    if immutable:
+        response["Cache-Control"] = "private, max-age=31536000, immutable"
+    else:
+        response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def build_file_response(request, name, path, etag, size):
+    header = settings.MEDIA_SENDFILE_HEADER
+    if header == "X-Accel-Redirect":
+        response = HttpResponse()
+        response[header] = quote(settings.MEDIA_ACCEL_PREFIX + name)
+        return response
+    if header:
+        response = HttpResponse()
+        response[header] = path
+        return response
+
+    try:
+        requested = byte_range(request, etag, size)
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    if requested is None:
+        response = FileResponse(open(path, "rb"))
+    else:
+        start, end = requested
+        response = StreamingHttpResponse(read_range(path, start, end), status=206)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = end - start + 1
+    response["Accept-Ranges"] = "bytes"
+    return response
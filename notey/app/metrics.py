@@ -0,0 +1,335 @@
+import asyncio
+import collections
+import contextvars
+import glob
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.template.backends import django as django_backend
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import sync_and_async_middleware
+
+METRICS = {
+    "notey_requests_total": ("counter", "Requests by view, method and status."),
+    "notey_request_duration_seconds": ("histogram", "Request latency by view."),
+    "notey_db_queries": ("histogram", "Database queries per request by view."),
+    "notey_db_query_duration_seconds_total": (
+        "counter",
+        "Time spent in queries by view.",
+    ),
+    "notey_template_render_seconds_total": ("counter", "Time spent rendering by view."),
+    "notey_response_bytes": ("histogram", "Response body size by view."),
+}
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+BUCKETS = {
+    "notey_request_duration_seconds": LATENCY_BUCKETS,
+    "notey_db_queries": (1, 2, 5, 10, 20, 50, 100),
+    "notey_response_bytes": (1024, 10240, 102400, 1048576),
+}
+UNRESOLVED_VIEW = "<unresolved>"
+
+request_stats = contextvars.ContextVar("request_stats", default=None)
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.render_seconds = 0.0
+
+
+class LocalValues:
+    """
+    Metric values of a single process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = collections.defaultdict(float)
+
+    def inc(self, key, amount):
+        with self.lock:
+            self.values[key] += amount
+
+    def collect(self):
+        with self.lock:
+            return dict(self.values)
+
+
+class MmapValues:
+    """
+    Metric values of one process, kept in a memory-mapped file so that other
+    worker processes can read them. The file holds the number of bytes used,
+    followed by entries of a key length, the padded key and a double.
+    """
+
+    INITIAL_SIZE = 64 * 1024
+    HEADER_SIZE = 8
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.file = open(path, "a+b")
+        if os.fstat(self.file.fileno()).st_size == 0:
+            self.file.truncate(self.INITIAL_SIZE)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.used = struct.unpack_from("I", self.map)[0] or self.HEADER_SIZE
+        self.positions = {
+            key: position for key, _, position in read_entries(self.map, self.used)
+        }
+
+    def inc(self, key, amount):
+        with self.lock:
+            position = self.positions.get(key)
+            if position is None:
+                position = self.append(key)
+            value = struct.unpack_from("d", self.map, position)[0]
+            struct.pack_into("d", self.map, position, value + amount)
+
+    def append(self, key):
+        encoded = key.encode()
+        padded = padded_length(encoded)
+        size = 4 + padded + 8
+        if self.used + size > len(self.map):
+            self.map.close()
+            self.file.truncate(max(2 * os.fstat(self.file.fileno()).st_size, size))
+            self.map = mmap.mmap(self.file.fileno(), 0)
+        struct.pack_into(f"I{padded}sd", self.map, self.used, len(encoded), encoded, 0)
+        position = self.used + 4 + padded
+        # Readers only look at entries within the used size, so it is updated
+        # once the entry is complete.
+        self.used += size
+        struct.pack_into("I", self.map, 0, self.used)
+        self.positions[key] = position
+        return position
+
+    def collect(self):
+        return {key: value for key, value, _ in read_entries(self.map, self.used)}
+
+
+def padded_length(encoded):
+    # Keeps the value after the key 8-byte aligned.
+    return len(encoded) + (-(len(encoded) + 4) % 8)
+
+
+def read_entries(data, used):
+    position = MmapValues.HEADER_SIZE
+    while position < used:
+        length = struct.unpack_from("I", data, position)[0]
+        key_position = position + 4
+        key = struct.unpack_from(f"{length}s", data, key_position)[0].decode()
+        value_position = key_position + length + (-(length + 4) % 8)
+        yield key, struct.unpack_from("d", data, value_position)[0], value_position
+        position = value_position + 8
+
+
+def read_file(path):
+    with open(path, "rb") as file:
+        data = file.read()
+    if len(data) < MmapValues.HEADER_SIZE:
+        return {}
+    used = struct.unpack_from("I", data)[0]
+    return {key: value for key, value, _ in read_entries(data, used)}
+
+
+_values = None
+_values_pid = None
+_values_lock = threading.Lock()
+
+
+def get_values():
+    global _values, _values_pid
+    # Reopened after a fork, so that every worker writes its own file.
+    if _values_pid != os.getpid():
+        with _values_lock:
+            if _values_pid != os.getpid():
+                if settings.METRICS_DIR:
+                    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+                    path = os.path.join(settings.METRICS_DIR, f"{os.getpid()}.db")
+                    _values = MmapValues(path)
+                else:
+                    _values = LocalValues()
+                _values_pid = os.getpid()
+    return _values
+
+
+def collect():
+    if not settings.METRICS_DIR:
+        return get_values().collect()
+    totals = collections.defaultdict(float)
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, "*.db")):
+        for key, value in read_file(path).items():
+            totals[key] += value
+    return totals
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def sample(name, **labels):
+    labels = ",".join(f'{key}="{escape_label(value)}"' for key, value in labels.items())
+    return f"{name}{{{labels}}}"
+
+
+def inc(name, amount=1, **labels):
+    get_values().inc(sample(name, **labels), amount)
+
+
+def observe(name, value, **labels):
+    values = get_values()
+    for bound in BUCKETS[name]:
+        values.inc(sample(f"{name}_bucket", **labels, le=bound), int(value <= bound))
+    values.inc(sample(f"{name}_bucket", **labels, le="+Inf"), 1)
+    values.inc(sample(f"{name}_sum", **labels), value)
+    values.inc(sample(f"{name}_count", **labels), 1)
+
+
+BUCKET_BOUND = re.compile(r',?le="([^"]*)"')
+
+
+def sort_key(key):
+    # Groups the samples of each label set, with buckets in increasing order.
+    name, labels = key[:-1].split("{", 1)
+    bound = BUCKET_BOUND.search(labels)
+    return (
+        family(key),
+        BUCKET_BOUND.sub("", labels),
+        name,
+        float(bound[1] if bound else 0),
+    )
+
+
+def family(key):
+    name = key.split("{")[0]
+    for suffix in ("_bucket", "_sum", "_count"):
+        if name.endswith(suffix) and name[: -len(suffix)] in METRICS:
+            return name[: -len(suffix)]
+    return name
+
+
+def exposition(values):
+    lines = []
+    current = None
+    for key in sorted(values, key=sort_key):
+        name = family(key)
+        if name != current:
+            current = name
+            kind, description = METRICS[name]
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+        lines.append(f"{key} {values[key]!r}")
+    return "".join(f"{line}\n" for line in lines)
+
+
+def is_scraper(request):
+    if settings.METRICS_TOKEN:
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        return scheme.lower() == "bearer" and constant_time_compare(
+            token, settings.METRICS_TOKEN
+        )
+    return request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS
+
+
+def metrics(request):
+    if not is_scraper(request):
+        return HttpResponse(status=403)
+    return HttpResponse(exposition(collect()), content_type="text/plain; version=0.0.4")
+
+
+def record_query(execute, sql, params, many, context):
+    stats = request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.query_seconds += time.perf_counter() - started
+
+
+def record_request(request, response, stats, started):
+    match = getattr(request, "resolver_match", None)
+    view = match.view_name if match else UNRESOLVED_VIEW
+    inc(
+        "notey_requests_total",
+        view=view,
+        method=request.method,
+        status=response.status_code,
+    )
+    observe("notey_request_duration_seconds", time.perf_counter() - started, view=view)
+    observe("notey_db_queries", stats.queries, view=view)
+    inc("notey_db_query_duration_seconds_total", stats.query_seconds, view=view)
+    inc("notey_template_render_seconds_total", stats.render_seconds, view=view)
+    if not response.streaming:
+        observe("notey_response_bytes", len(response.content), view=view)
+    elif response.has_header("Content-Length"):
+        observe("notey_response_bytes", int(response["Content-Length"]), view=view)
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """
+    Records latency, query count and time, template render time and response
+    size of every request, labelled with the view's URL name.
+    """
+    if asyncio.iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            stats, started = RequestStats(), time.perf_counter()
+            token = request_stats.set(stats)
+            try:
+                response = await get_response(request)
+            finally:
+                request_stats.reset(token)
+            record_request(request, response, stats, started)
+            return response
+
+    else:
+
+        def middleware(request):
+            stats, started = RequestStats(), time.perf_counter()
+            token = request_stats.set(stats)
+            try:
+                response = get_response(request)
+            finally:
+                request_stats.reset(token)
+            record_request(request, response, stats, started)
+            return response
+
+    return middleware
+
+
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        stats = request_stats.get()
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            if stats is not None:
+                stats.render_seconds += time.perf_counter() - started
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """
+    The Django template backend, timing how long each request spends
+    rendering templates.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
@@ -0,0 +1,47 @@
+# Generated by Django 4.1.7 on 2026-10-18 09:12
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def fill_counters(apps, schema_editor):
+    Project = apps.get_model("app", "Project")
+    projects = Project.objects.annotate(
+        actual_note_count=Count("note", distinct=True),
+        actual_open_note_count=Count(
+            "note", filter=Q(note__is_completed=False), distinct=True
+        ),
+        actual_attachment_count=Count("note__attachment", distinct=True),
+    )
+    for project in projects:
+        project.note_count = project.actual_note_count
+        project.open_note_count = project.actual_open_note_count
+        project.attachment_count = project.actual_attachment_count
+    Project.objects.bulk_update(
+        projects, ["note_count", "open_note_count", "attachment_count"]
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app", "0023_remove_note_attachment_attachment"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="project",
+            name="attachment_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="project",
+            name="note_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="project",
+            name="open_note_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,94 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:40
+
+import hashlib
+import os
+
+import app.models
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+from django.db.models import F
+import django.db.models.deletion
+
+
+def move_files_to_blobs(apps, schema_editor):
+    Attachment = apps.get_model("app", "Attachment")
+    Blob = apps.get_model("app", "Blob")
+
+    for attachment in Attachment.objects.all():
+        name = attachment.file.name
+        digest = hashlib.sha256()
+        size = 0
+        if default_storage.exists(name):
+            with default_storage.open(name, "rb") as file:
+                for chunk in file.chunks():
+                    digest.update(chunk)
+                    size += len(chunk)
+        else:
+            # Keep rows whose file has gone missing under a digest of their path.
+            digest.update(name.encode())
+        digest = digest.hexdigest()
+
+        blob, created = Blob.objects.get_or_create(
+            digest=digest, defaults={"file": name, "size": size}
+        )
+        if not created:
+            Blob.objects.filter(pk=digest).update(ref_count=F("ref_count") + 1)
+            if blob.file.name != name and default_storage.exists(name):
+                default_storage.delete(name)
+
+        attachment.blob = blob
+        attachment.name = os.path.basename(name)
+        attachment.save(update_fields=["blob", "name"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app", "0025_upload"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Blob",
+            fields=[
+                (
+                    "digest",
+                    models.CharField(max_length=64, primary_key=True, serialize=False),
+                ),
+                (
+                    "file",
+                    models.FileField(
+                        max_length=255, upload_to=app.models.blob_upload_to
+                    ),
+                ),
+                ("size", models.PositiveBigIntegerField()),
+                ("ref_count", models.PositiveIntegerField(default=1)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="attachment",
+            name="blob",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                to="app.blob",
+            ),
+        ),
+        migrations.AddField(
+            model_name="attachment",
+            name="name",
+            field=models.CharField(default="", max_length=255),
+            preserve_default=False,
+        ),
+        migrations.RunPython(move_files_to_blobs, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="attachment",
+            name="file",
+        ),
+        migrations.AlterField(
+            model_name="attachment",
+            name="blob",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.PROTECT, to="app.blob"
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app", "0026_content_addressed_attachments"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="note",
+            name="version",
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
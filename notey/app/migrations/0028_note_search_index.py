@@ -0,0 +1,45 @@
+# Generated by Django 4.1.7 on 2026-10-18 15:02
+
+from django.db import migrations
+
+# The schema as of this migration, rather than app.search's current one.
+CREATE_INDEX_SQL = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS app_note_fts
+    USING fts5(text, filenames, tokenize='unicode61 remove_diacritics 2')
+"""
+
+INDEX_NOTES_SQL = """
+    INSERT INTO app_note_fts (rowid, text, filenames)
+    SELECT note.id, note.text, COALESCE(
+        (
+            SELECT group_concat(attachment.name, ' ')
+            FROM app_attachment AS attachment
+            WHERE attachment.note_id = note.id
+        ),
+        ''
+    )
+    FROM app_note AS note
+"""
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(CREATE_INDEX_SQL)
+    schema_editor.execute(INDEX_NOTES_SQL)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS app_note_fts")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app", "0027_note_version"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.1.7 on 2026-10-18 14:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        # Later auth migrations may rebuild auth_user and drop the email index.
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("app", "0029_timestamps"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="note",
+            index=models.Index(
+                condition=models.Q(("is_completed", False)),
+                fields=["project", "id"],
+                name="app_note_open_idx",
+            ),
+        ),
+        # NewUserForm.clean_email compares LOWER(email). auth_user belongs to
+        # another app, so its index is created here.
+        migrations.RunSQL(
+            "CREATE INDEX app_user_email_lower_idx ON auth_user (LOWER(email))",
+            "DROP INDEX app_user_email_lower_idx",
+        ),
+    ]
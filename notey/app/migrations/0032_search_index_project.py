@@ -0,0 +1,72 @@
+# Generated by Django 4.1.7 on 2026-10-18 20:14
+
+from django.db import migrations
+
+# The schema as of this migration, rather than app.search's current one.
+CREATE_INDEX_SQL = """
+    CREATE VIRTUAL TABLE app_note_fts
+    USING fts5(text, filenames, project, tokenize='unicode61 remove_diacritics 2')
+"""
+
+RANK_SQL = """
+    INSERT INTO app_note_fts (app_note_fts, rank)
+    VALUES ('rank', 'bm25(1.0, 1.0, 0.0)')
+"""
+
+OLD_CREATE_INDEX_SQL = """
+    CREATE VIRTUAL TABLE app_note_fts
+    USING fts5(text, filenames, tokenize='unicode61 remove_diacritics 2')
+"""
+
+INDEX_NOTES_SQL = """
+    INSERT INTO app_note_fts (rowid, text, filenames, project)
+    SELECT note.id, note.text, COALESCE(
+        (
+            SELECT group_concat(attachment.name, ' ')
+            FROM app_attachment AS attachment
+            WHERE attachment.note_id = note.id
+        ),
+        ''
+    ), note.project_id
+    FROM app_note AS note
+"""
+
+OLD_INDEX_NOTES_SQL = """
+    INSERT INTO app_note_fts (rowid, text, filenames)
+    SELECT note.id, note.text, COALESCE(
+        (
+            SELECT group_concat(attachment.name, ' ')
+            FROM app_attachment AS attachment
+            WHERE attachment.note_id = note.id
+        ),
+        ''
+    )
+    FROM app_note AS note
+"""
+
+
+def add_project_column(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS app_note_fts")
+    schema_editor.execute(CREATE_INDEX_SQL)
+    schema_editor.execute(RANK_SQL)
+    schema_editor.execute(INDEX_NOTES_SQL)
+
+
+def remove_project_column(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS app_note_fts")
+    schema_editor.execute(OLD_CREATE_INDEX_SQL)
+    schema_editor.execute(OLD_INDEX_NOTES_SQL)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app", "0031_projectsnapshot"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_project_column, remove_project_column),
+    ]
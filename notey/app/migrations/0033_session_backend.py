@@ -0,0 +1,43 @@
+# Generated by Django 4.1.7 on 2026-10-18 21:02
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.contrib.sessions.backends.cached_db import SessionStore
+from django.core.cache import caches
+from django.db import migrations
+from django.utils import timezone
+
+OLD_BACKEND = "django.contrib.auth.backends.ModelBackend"
+NEW_BACKEND = "app.auth.CachedModelBackend"
+
+
+def switch_session_backend(apps, schema_editor, old=OLD_BACKEND, new=NEW_BACKEND):
+    Session = apps.get_model("sessions", "Session")
+    store = SessionStore()
+    cache = caches[settings.SESSION_CACHE_ALIAS]
+    sessions = Session.objects.using(schema_editor.connection.alias).filter(
+        expire_date__gt=timezone.now()
+    )
+    for session in sessions.iterator():
+        data = store.decode(session.session_data)
+        if data.get(BACKEND_SESSION_KEY) != old:
+            continue
+        data[BACKEND_SESSION_KEY] = new
+        session.session_data = store.encode(data)
+        session.save(update_fields=["session_data"])
+        cache.delete(store.cache_key_prefix + session.session_key)
+
+
+def restore_session_backend(apps, schema_editor):
+    switch_session_backend(apps, schema_editor, old=NEW_BACKEND, new=OLD_BACKEND)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app", "0032_search_index_project"),
+        ("sessions", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(switch_session_backend, restore_session_backend),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.7 on 2026-10-18 22:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("app", "0034_apitoken"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="upload",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
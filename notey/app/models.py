@@ -1,10 +1,82 @@
+import collections
+import datetime
+import hashlib
+import json
+import os
+import secrets
+import shutil
+import tempfile
+import uuid
+import zlib
+
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
+from django.core.cache import cache
+from django.core.files import File
+from django.db import models, transaction
+from django.db.models import Count, F, Prefetch, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import search
+from .events import publish_note_event
+
+DEFAULT_COLOR = "#FFFFFF"
+# Colors are updated in the cache on save. The timeout bounds how long a
+# change that bypassed the signals, like a bulk update, stays unseen.
+COLOR_CACHE_TIMEOUT = 60 * 60
+
+
+def color_cache_key(user_id):
+    return f"profile_color:{user_id}"
+
+
+class ProfileQuerySet(models.QuerySet):
+    """
+    Note cards only need their author's color, which is served from a cached
+    user -> color map rather than by joining every note to its profile.
+    """
+
+    def colors(self, user_ids):
+        keys = {color_cache_key(user_id): user_id for user_id in set(user_ids)}
+        colors = {keys[key]: color for key, color in cache.get_many(keys).items()}
+        missing = set(keys.values()) - colors.keys()
+        if missing:
+            fetched = dict(
+                self.filter(user_id__in=missing).values_list("user_id", "color")
+            )
+            cache.set_many(
+                {color_cache_key(user_id): color for user_id, color in fetched.items()},
+                COLOR_CACHE_TIMEOUT,
+            )
+            colors.update(fetched)
+        return colors
+
+    async def acolors(self, user_ids):
+        keys = {color_cache_key(user_id): user_id for user_id in set(user_ids)}
+        cached = await cache.aget_many(keys)
+        colors = {keys[key]: color for key, color in cached.items()}
+        missing = set(keys.values()) - colors.keys()
+        if missing:
+            fetched = {
+                user_id: color
+                async for user_id, color in self.filter(
+                    user_id__in=missing
+                ).values_list("user_id", "color")
+            }
+            await cache.aset_many(
+                {color_cache_key(user_id): color for user_id, color in fetched.items()},
+                COLOR_CACHE_TIMEOUT,
+            )
+            colors.update(fetched)
+        return colors
 
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
-    color = models.CharField(max_length=9, default="#FFFFFF")
+    color = models.CharField(max_length=9, default=DEFAULT_COLOR)
+
+    objects = ProfileQuerySet.as_manager()
 
     def __str__(self) -> str:
         return f"{self.user.username}'s profile"
@@ -13,6 +85,44 @@ class Profile(models.Model):
 DEFAULT_PROJECT_IMAGE = "images/projects/DEFAULT_PROJECT_IMAGE.jpg"
 
 
+class ProjectQuerySet(models.QuerySet):
+    def for_user(self, user):
+        return self.filter(project__user=user)
+
+    def active(self):
+        return self.filter(is_archived=False)
+
+    def archived(self):
+        return self.filter(is_archived=True)
+
+    def visible_to(self, user, archived=False):
+        projects = self.for_user(user)
+        projects = projects.archived() if archived else projects.active()
+        return projects.order_by("name")
+
+    def touch(self):
+        return self.update(changed_at=timezone.now())
+
+    def adjust_counters(self, notes=0, open_notes=0, attachments=0):
+        # Every counter change is a change to the project, so the same UPDATE
+        # also bumps its last changed marker.
+        return self.update(
+            note_count=F("note_count") + notes,
+            open_note_count=F("open_note_count") + open_notes,
+            attachment_count=F("attachment_count") + attachments,
+            changed_at=timezone.now(),
+        )
+
+    def with_actual_counters(self):
+        return self.annotate(
+            actual_note_count=Count("note", distinct=True),
+            actual_open_note_count=Count(
+                "note", filter=Q(note__is_completed=False), distinct=True
+            ),
+            actual_attachment_count=Count("note__attachment", distinct=True),
+        )
+
+
 class Project(models.Model):
     creator = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     name = models.CharField(max_length=128, unique=True)
@@ -20,16 +130,40 @@ class Project(models.Model):
         upload_to="images/projects/", default=DEFAULT_PROJECT_IMAGE
     )
     is_archived = models.BooleanField(default=False)
+    note_count = models.PositiveIntegerField(default=0)
+    open_note_count = models.PositiveIntegerField(default=0)
+    attachment_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Bumped whenever the project, its members, notes or attachments change.
+    changed_at = models.DateTimeField(auto_now=True)
+
+    objects = ProjectQuerySet.as_manager()
+
+    COUNTER_FIELDS = ["note_count", "open_note_count", "attachment_count"]
 
     def __str__(self) -> str:
         return f"[{self.creator.username}]{self.name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_image = instance.__dict__.get("image")
+        return instance
+
     def get_notes(self):
         return Note.objects.filter(project=self)
 
     def get_users(self):
         return ProjectUser.objects.filter(project=self)
 
+    def refresh_counters(self):
+        self.refresh_from_db(fields=self.COUNTER_FIELDS)
+
+    @property
+    def is_archiveable(self):
+        return self.note_count > 0 and self.open_note_count == 0
+
 
 class ProjectUserPermission(models.TextChoices):
     DELETE = "RWCD", "Read, write, complete and delete"
@@ -54,6 +188,8 @@ class ProjectUser(models.Model):
         on_delete=models.CASCADE,
         related_name="project",
     )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ("user", "project")
@@ -61,27 +197,113 @@ class ProjectUser(models.Model):
     def __str__(self) -> str:
         return f"{self.user.username}-{self.project.name} [{self.permission}]"
 
-    def getProjects(user: User):
-        projectUser = ProjectUser.objects.all().filter(user=user)
-        temp = []
-        projects = []
-        for el in projectUser:
-            temp.append(el.project)
-        for project in temp:
-            if not project.is_archived:
-                projects.append(project)
-        return projects
-
-    def getArchivedProjects(user: User):
-        projectUser = ProjectUser.objects.all().filter(user=user)
-        projects = []
-        for el in projectUser:
-            projects.append(el.project)
-        archived_projects = []
-        for project in projects:
-            if project.is_archived:
-                archived_projects.append(project)
-        return archived_projects
+    @property
+    def can_write(self):
+        return "W" in self.permission
+
+    @property
+    def can_complete(self):
+        return "C" in self.permission
+
+    @property
+    def can_delete(self):
+        return "D" in self.permission
+
+
+class NoteQuerySet(models.QuerySet):
+    def with_details(self):
+        return self.select_related("user").prefetch_related(
+            Prefetch(
+                "attachment_set",
+                queryset=Attachment.objects.select_related("blob"),
+            )
+        )
+
+    def permitted(self, user, permission):
+        return self.filter(
+            project__project__user=user,
+            project__project__permission__contains=permission,
+        )
+
+    def feed(self, before=None):
+        notes = self.order_by("-id")
+        if before is not None:
+            notes = notes.filter(id__lt=before)
+        return notes
+
+    # Bulk operations skip the per-note signals, so they keep the project
+    # counters, blob references and search index up to date themselves.
+
+    def create_in_bulk(self, notes):
+        with transaction.atomic():
+            notes = self.bulk_create(notes)
+            added = collections.defaultdict(list)
+            for note in notes:
+                added[note.project_id].append(note.id)
+            opened = collections.Counter(
+                note.project_id for note in notes if not note.is_completed
+            )
+            for project_id, added_ids in added.items():
+                Project.objects.filter(pk=project_id).adjust_counters(
+                    notes=len(added_ids), open_notes=opened[project_id]
+                )
+                publish_note_event(project_id, "created", added_ids)
+            search.index_notes([note.id for note in notes])
+        return notes
+
+    def set_completed(self, completed):
+        with transaction.atomic():
+            changed = self.filter(is_completed=not completed)
+            per_project = collections.defaultdict(list)
+            for note_id, project_id in changed.order_by().values_list(
+                "id", "project_id"
+            ):
+                per_project[project_id].append(note_id)
+            updated = changed.update(
+                is_completed=completed,
+                version=F("version") + 1,
+                updated_at=timezone.now(),
+            )
+            for project_id, note_ids in per_project.items():
+                Project.objects.filter(pk=project_id).adjust_counters(
+                    open_notes=-len(note_ids) if completed else len(note_ids)
+                )
+                publish_note_event(
+                    project_id, "completed" if completed else "reopened", note_ids
+                )
+        return updated
+
+    def delete_in_bulk(self):
+        with transaction.atomic():
+            notes = list(
+                self.order_by().values_list("id", "project_id", "is_completed")
+            )
+            note_ids = [note_id for note_id, _, _ in notes]
+            attachments = Attachment.objects.filter(note_id__in=note_ids)
+            references = list(attachments.values_list("note__project_id", "blob_id"))
+
+            attachments._raw_delete(attachments.db)
+            deleted = Note.objects.filter(id__in=note_ids)._raw_delete(self.db)
+
+            removed = collections.defaultdict(list)
+            for note_id, project_id, _ in notes:
+                removed[project_id].append(note_id)
+            closed = collections.Counter(
+                project_id for _, project_id, completed in notes if not completed
+            )
+            detached = collections.Counter(project_id for project_id, _ in references)
+            for project_id, removed_ids in removed.items():
+                Project.objects.filter(pk=project_id).adjust_counters(
+                    notes=-len(removed_ids),
+                    open_notes=-closed[project_id],
+                    attachments=-detached[project_id],
+                )
+                publish_note_event(project_id, "deleted", removed_ids)
+            blobs = collections.Counter(blob_id for _, blob_id in references)
+            for digest, count in blobs.items():
+                Blob.objects.release(digest, references=count)
+            search.unindex_notes(note_ids)
+        return deleted
 
 
 class Note(models.Model):
@@ -89,6 +311,28 @@ class Note(models.Model):
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     project = models.ForeignKey(Project, on_delete=models.CASCADE)
     is_completed = models.BooleanField(default=False)
+    version = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = NoteQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Django compares booleans as "NOT is_completed", which only a
+            # partial index with the same condition can serve.
+            models.Index(
+                fields=["project", "id"],
+                condition=Q(is_completed=False),
+                name="app_note_open_idx",
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_is_completed = instance.__dict__.get("is_completed")
+        return instance
 
     def __str__(self) -> str:
         if self.is_completed:
@@ -96,18 +340,343 @@ class Note(models.Model):
         return f"[-]{self.text} on {self.project.name}"
 
     def get_attachments(self):
-        attachments = Attachment.objects.all()
-        return attachments.filter(note=self)
+        return self.attachment_set.all()
+
+
+def blob_upload_to(instance, filename):
+    extension = os.path.splitext(filename)[1]
+    return f"attachment/blobs/{instance.digest[:2]}/{instance.digest}{extension}"
+
+
+class BlobManager(models.Manager):
+    def store(self, content, name):
+        digest = hashlib.sha256()
+        size = 0
+        content.open("rb")
+        for chunk in content.chunks():
+            digest.update(chunk)
+            size += len(chunk)
+        digest = digest.hexdigest()
+
+        with transaction.atomic():
+            blob, created = self.select_for_update().get_or_create(
+                digest=digest, defaults={"size": size}
+            )
+            if created:
+                blob.file.save(name, content)
+            else:
+                self.filter(pk=digest).update(ref_count=F("ref_count") + 1)
+        return blob
+
+    def release(self, digest, references=1):
+        self.filter(pk=digest).update(ref_count=F("ref_count") - references)
+        unreferenced = self.filter(pk=digest, ref_count__lte=0)
+        blob = unreferenced.first()
+        if blob is not None and unreferenced.delete()[0]:
+            # A rolled back release must leave the file in place.
+            transaction.on_commit(lambda: blob.file.delete(save=False))
+
+
+class Blob(models.Model):
+    digest = models.CharField(max_length=64, primary_key=True)
+    file = models.FileField(upload_to=blob_upload_to, max_length=255)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=1)
+
+    objects = BlobManager()
+
+    def __str__(self) -> str:
+        return f"{self.digest} [{self.ref_count}]"
+
+
+class AttachmentManager(models.Manager):
+    def create_from_file(self, note, file, name=None):
+        name = name or os.path.basename(file.name)
+        blob = Blob.objects.store(file, name)
+        return self.create(note=note, blob=blob, name=name)
 
 
 class Attachment(models.Model):
     note = models.ForeignKey(Note, on_delete=models.CASCADE)
-    file = models.FileField(upload_to="attachment/note/")
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT)
+    name = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = AttachmentManager()
 
     def __str__(self) -> str:
         return f"{self.note}"
 
+    @property
+    def file(self):
+        return self.blob.file
+
     def filename(self):
-        filename_with_root_dir = self.file.name
-        ROOT_DIR = "attachment/note/"
-        return filename_with_root_dir.replace(ROOT_DIR, "")
+        return self.name
+
+
+def parse_timestamps(row):
+    for field in ("created_at", "updated_at"):
+        row[field] = parse_datetime(row[field])
+    return row
+
+
+def bulk_create_with_timestamps(manager, objs):
+    # Inserts stamp the auto_now fields of each object with the current time.
+    timestamps = [(obj.created_at, obj.updated_at) for obj in objs]
+    manager.bulk_create(objs)
+    for obj, (created_at, updated_at) in zip(objs, timestamps):
+        obj.created_at, obj.updated_at = created_at, updated_at
+    manager.bulk_update(objs, ["created_at", "updated_at"])
+
+
+class ProjectSnapshotManager(models.Manager):
+    """
+    Archived projects keep their notes and attachments in one compressed
+    snapshot rather than in the live tables. While archived, the snapshot
+    holds the references to the attachments' blobs.
+    """
+
+    NOTE_FIELDS = [
+        "id",
+        "text",
+        "user_id",
+        "is_completed",
+        "version",
+        "created_at",
+        "updated_at",
+    ]
+    ATTACHMENT_FIELDS = ["id", "blob_id", "name", "created_at", "updated_at"]
+
+    def compact(self, project):
+        with transaction.atomic():
+            snapshot = self.select_for_update().filter(project=project).first()
+            if snapshot is not None:
+                return snapshot
+            notes = Note.objects.filter(project=project)
+            attachments = Attachment.objects.filter(note__project=project)
+            rows = list(notes.order_by("id").values(*self.NOTE_FIELDS))
+            per_note = collections.defaultdict(list)
+            for row in attachments.order_by("id").values(
+                "note_id", *self.ATTACHMENT_FIELDS
+            ):
+                per_note[row.pop("note_id")].append(row)
+            for row in rows:
+                row["attachments"] = per_note[row["id"]]
+            authors = User.objects.filter(id__in={row["user_id"] for row in rows})
+            data = {
+                "authors": dict(authors.values_list("id", "username")),
+                "notes": rows,
+            }
+            snapshot = self.create(
+                project=project,
+                # isoformat() keeps the microseconds DjangoJSONEncoder drops.
+                data=zlib.compress(
+                    json.dumps(data, default=datetime.datetime.isoformat).encode()
+                ),
+            )
+            attachments._raw_delete(attachments.db)
+            notes._raw_delete(notes.db)
+            search.unindex_notes([row["id"] for row in rows])
+        return snapshot
+
+    def restore(self, project):
+        with transaction.atomic():
+            snapshot = self.select_for_update().filter(project=project).first()
+            if snapshot is None:
+                return []
+            data = snapshot.load()
+            # Authors deleted while the project was archived.
+            users = set(
+                User.objects.filter(id__in=data["authors"]).values_list("id", flat=True)
+            )
+            notes, attachments = [], []
+            for row in data["notes"]:
+                for attachment in row.pop("attachments"):
+                    attachments.append(
+                        Attachment(note_id=row["id"], **parse_timestamps(attachment))
+                    )
+                if row["user_id"] not in users:
+                    row["user_id"] = None
+                notes.append(Note(project=project, **parse_timestamps(row)))
+
+            bulk_create_with_timestamps(Note.objects, notes)
+            bulk_create_with_timestamps(Attachment.objects, attachments)
+            # The blob references pass back to the attachments.
+            self.filter(pk=snapshot.pk)._raw_delete(self.db)
+            search.index_notes([note.id for note in notes])
+        return notes
+
+
+class ProjectSnapshot(models.Model):
+    project = models.OneToOneField(
+        Project, on_delete=models.CASCADE, primary_key=True, related_name="snapshot"
+    )
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ProjectSnapshotManager()
+
+    def __str__(self) -> str:
+        return f"{self.project.name} snapshot"
+
+    def load(self):
+        data = json.loads(zlib.decompress(self.data))
+        data["authors"] = {int(key): name for key, name in data["authors"].items()}
+        return data
+
+    def get_notes(self):
+        """
+        The archived notes as unsaved instances, each with its author and its
+        attachments in note.attachments.
+        """
+        data = self.load()
+        authors = {
+            user_id: User(id=user_id, username=username)
+            for user_id, username in data["authors"].items()
+        }
+        notes = []
+        for row in data["notes"]:
+            attachment_rows = row.pop("attachments")
+            note = Note(project_id=self.project_id, **parse_timestamps(row))
+            note.user = authors.get(note.user_id)
+            note.attachments = [
+                Attachment(note=note, **parse_timestamps(attachment))
+                for attachment in attachment_rows
+            ]
+            notes.append(note)
+        return notes
+
+    def get_attachment(self, attachment_id):
+        for note in self.get_notes():
+            for attachment in note.attachments:
+                if attachment.id == attachment_id:
+                    return attachment
+        return None
+
+    def blob_references(self):
+        return collections.Counter(
+            attachment["blob_id"]
+            for note in self.load()["notes"]
+            for attachment in note["attachments"]
+        )
+
+
+class UploadedPart(File):
+    """
+    An assembled upload on disk. Storage moves it into place instead of
+    copying it.
+    """
+
+    def __init__(self, path):
+        super().__init__(None, path)
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
+
+
+class UploadQuerySet(models.QuerySet):
+    def complete(self):
+        return self.filter(offset=F("size"))
+
+    def stale(self):
+        return self.filter(updated_at__lt=timezone.now() - Upload.EXPIRES_AFTER)
+
+
+class Upload(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = UploadQuerySet.as_manager()
+
+    ROOT_DIR = "uploads/partial/"
+    BLOCK_SIZE = 64 * 1024
+    # Chunks up to this size are received in memory, larger ones on disk.
+    SPOOL_SIZE = 1024 * 1024
+    # Uploads not written to or attached for this long are deleted by the
+    # delete_stale_uploads command.
+    EXPIRES_AFTER = datetime.timedelta(days=1)
+
+    def __str__(self) -> str:
+        return f"{self.filename} [{self.offset}/{self.size}]"
+
+    def path(self):
+        return os.path.join(settings.MEDIA_ROOT, self.ROOT_DIR, f"{self.id}.part")
+
+    @property
+    def is_complete(self):
+        return self.offset == self.size
+
+    def write_chunk(self, stream, offset, length):
+        """
+        Appends a chunk sent for the given offset, unless another request
+        moved the offset first. The chunk is received before the upload's row
+        is locked, so slow clients don't hold the lock.
+        """
+        with tempfile.SpooledTemporaryFile(self.SPOOL_SIZE) as chunk:
+            remaining = length
+            while remaining > 0:
+                block = stream.read(min(self.BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                chunk.write(block)
+                remaining -= len(block)
+            chunk.seek(0)
+
+            with transaction.atomic():
+                self.offset = (
+                    Upload.objects.select_for_update()
+                    .values_list("offset", flat=True)
+                    .get(pk=self.pk)
+                )
+                if self.offset != offset:
+                    return False
+                os.makedirs(os.path.dirname(self.path()), exist_ok=True)
+                with open(self.path(), "ab") as part:
+                    # Drop bytes left behind by an interrupted chunk.
+                    part.truncate(self.offset)
+                    shutil.copyfileobj(chunk, part, self.BLOCK_SIZE)
+                self.offset += length - remaining
+                self.save(update_fields=["offset", "updated_at"])
+        return True
+
+    def attach_to(self, note):
+        with UploadedPart(self.path()) as part:
+            attachment = Attachment.objects.create_from_file(note, part, self.filename)
+        # Removes the part too, if the payload was already stored and the part
+        # was not moved.
+        self.delete()
+        return attachment
+
+
+class ApiTokenManager(models.Manager):
+    def create_for(self, user):
+        """
+        Returns a new token of the user and its key, which is only known
+        until then.
+        """
+        key = secrets.token_urlsafe(32)
+        return self.create(user=user, digest=api_token_digest(key)), key
+
+
+def api_token_digest(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class ApiToken(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Keys are random, so an unsalted digest is enough to keep them secret.
+    digest = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ApiTokenManager()
+
+    def __str__(self) -> str:
+        return f"{self.user.username} token {self.id}"
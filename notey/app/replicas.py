@@ -0,0 +1,95 @@
+import asyncio
+import contextvars
+import random
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.decorators import sync_and_async_middleware
+
+PIN_COOKIE = "primary_pin"
+
+replica_state = contextvars.ContextVar("replica_state", default=None)
+
+
+class ReplicaState:
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.wrote = False
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of requests that have not written anything to one of
+    DATABASE_REPLICAS, and everything else to the primary. Reads outside
+    requests and inside transactions always go to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = replica_state.get()
+        if (
+            state is None
+            or state.pinned
+            or state.wrote
+            or not settings.DATABASE_REPLICAS
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = replica_state.get()
+        if state is not None:
+            # Read the rest of the request back from the primary.
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+def finish_request(state, response):
+    # Keeps the client's next requests on the primary until the replicas have
+    # caught up with what it wrote.
+    if state.wrote and settings.DATABASE_REPLICAS:
+        response.set_cookie(
+            PIN_COOKIE,
+            "1",
+            max_age=settings.REPLICA_PIN_SECONDS,
+            httponly=True,
+            samesite="Lax",
+        )
+    return response
+
+
+@sync_and_async_middleware
+def replica_middleware(get_response):
+    """
+    Tracks whether a request writes, for ReplicaRouter, and pins clients that
+    wrote to the primary for REPLICA_PIN_SECONDS.
+    """
+    if asyncio.iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            state = ReplicaState(PIN_COOKIE in request.COOKIES)
+            token = replica_state.set(state)
+            try:
+                response = await get_response(request)
+            finally:
+                replica_state.reset(token)
+            return finish_request(state, response)
+
+    else:
+
+        def middleware(request):
+            state = ReplicaState(PIN_COOKIE in request.COOKIES)
+            token = replica_state.set(state)
+            try:
+                response = get_response(request)
+            finally:
+                replica_state.reset(token)
+            return finish_request(state, response)
+
+    return middleware
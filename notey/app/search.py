@@ -0,0 +1,151 @@
+import re
+
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+FTS_TABLE = "app_note_fts"
+SNIPPET_TOKENS = 16
+PREFIX_MIN_LENGTH = 3
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+
+INDEX_NOTE_SQL = f"""
+    INSERT INTO {FTS_TABLE} (rowid, text, filenames, project)
+    SELECT note.id, note.text, COALESCE(
+        (
+            SELECT group_concat(attachment.name, ' ')
+            FROM app_attachment AS attachment
+            WHERE attachment.note_id = note.id
+        ),
+        ''
+    ), note.project_id
+    FROM app_note AS note
+"""
+
+SEARCH_SQL = f"""
+    SELECT
+        note.id,
+        note.project_id,
+        project.name,
+        project.is_archived,
+        snippet({FTS_TABLE}, 0, %s, %s, '…', {SNIPPET_TOKENS}),
+        snippet({FTS_TABLE}, 1, %s, %s, '…', {SNIPPET_TOKENS})
+    FROM {FTS_TABLE}
+    JOIN app_note AS note ON note.id = {FTS_TABLE}.rowid
+    JOIN app_project AS project ON project.id = note.project_id
+    JOIN app_projectuser AS member
+        ON member.project_id = note.project_id AND member.user_id = %s
+    WHERE {FTS_TABLE} MATCH %s
+    ORDER BY {FTS_TABLE}.rank
+    LIMIT %s OFFSET %s
+"""
+
+
+def is_available():
+    return connection.vendor == "sqlite"
+
+
+def create_index(cursor):
+    # Each note's project id is indexed as a token, so that the MATCH itself
+    # only finds notes of the user's projects, and bm25 only ranks those. It
+    # has no weight in the ranking.
+    cursor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        "text, filenames, project, tokenize='unicode61 remove_diacritics 2')"
+    )
+    cursor.execute(
+        f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rank) "
+        "VALUES ('rank', 'bm25(1.0, 1.0, 0.0)')"
+    )
+
+
+def rebuild_index():
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+        create_index(cursor)
+        cursor.execute(INDEX_NOTE_SQL)
+        return cursor.rowcount
+
+
+def index_notes(note_ids):
+    if not is_available() or not note_ids:
+        return
+    placeholders = ", ".join(["%s"] * len(note_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", note_ids
+        )
+        cursor.execute(INDEX_NOTE_SQL + f" WHERE note.id IN ({placeholders})", note_ids)
+
+
+def unindex_notes(note_ids):
+    if not is_available() or not note_ids:
+        return
+    placeholders = ", ".join(["%s"] * len(note_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", note_ids
+        )
+
+
+def index_note(note_id):
+    index_notes([note_id])
+
+
+def unindex_note(note_id):
+    unindex_notes([note_id])
+
+
+def match_expression(query, project_ids):
+    """
+    Turns free text into an FTS5 query of quoted words in the text and
+    filenames of notes in the given projects, so user input is never parsed
+    as FTS5 syntax. Only the last word matches as a prefix, as short prefixes
+    still match most notes of a large project.
+    """
+    terms = [f'"{term}"' for term in re.findall(r"\w+", query)]
+    if not terms or not project_ids:
+        return ""
+    if len(terms[-1]) - 2 >= PREFIX_MIN_LENGTH:
+        terms[-1] += "*"
+    projects = " OR ".join(f'"{project_id}"' for project_id in project_ids)
+    return f"{{text filenames}} : ({' AND '.join(terms)}) AND project : ({projects})"
+
+
+def highlight(snippet):
+    return mark_safe(
+        escape(snippet)
+        .replace(HIGHLIGHT_START, "<mark>")
+        .replace(HIGHLIGHT_END, "</mark>")
+    )
+
+
+def search_notes(user, query, limit, offset=0):
+    if not is_available():
+        return []
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT project_id FROM app_projectuser WHERE user_id = %s", [user.id]
+        )
+        expression = match_expression(query, [row[0] for row in cursor.fetchall()])
+        if not expression:
+            return []
+        highlights = [HIGHLIGHT_START, HIGHLIGHT_END] * 2
+        cursor.execute(SEARCH_SQL, highlights + [user.id, expression, limit, offset])
+        rows = cursor.fetchall()
+
+    return [
+        {
+            "note_id": note_id,
+            "project_id": project_id,
+            "project_name": project_name,
+            "is_archived": is_archived,
+            # The text, unless only the filenames matched.
+            "snippet": highlight(
+                text if HIGHLIGHT_START in text or not filenames else filenames
+            ),
+        }
+        for note_id, project_id, project_name, is_archived, text, filenames in rows
+    ]
@@ -1,8 +1,40 @@
+import contextlib
+import os
+
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.core.cache import cache
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models import F, Q
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
+from django.utils import timezone
+
+from .auth import invalidate_user
+from .decorators import invalidate_project_users
+from .events import publish_note_event
+from .metrics import record_query
+from .models import (
+    COLOR_CACHE_TIMEOUT,
+    Attachment,
+    Blob,
+    Note,
+    Profile,
+    Project,
+    ProjectSnapshot,
+    ProjectUser,
+    Upload,
+    color_cache_key,
+)
+from .search import index_note, unindex_note
+from .thumbnails import generate_thumbnails
 
-from .models import Profile, Project, ProjectUser
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # Fired again on every reconnect of the same wrapper.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
 
 
 @receiver(post_save, sender=User)
@@ -11,6 +43,178 @@ def create_profile(sender, instance, created, **kwargs):
         Profile.objects.create(user=instance)
 
 
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_user(instance.id)
+
+
+def touch_author_projects(user_id):
+    # Project pages show the names and colors of their members and authors.
+    Project.objects.filter(
+        Q(project__user_id=user_id) | Q(note__user_id=user_id)
+    ).touch()
+
+
 @receiver(post_save, sender=User)
-def save_profile(sender, instance, **kwargs):
-    instance.profile.save()
+def touch_renamed_user_projects(sender, instance, created, update_fields, **kwargs):
+    if not created and (update_fields is None or "username" in update_fields):
+        touch_author_projects(instance.id)
+
+
+@receiver(post_save, sender=Profile)
+def touch_recolored_user_projects(sender, instance, created, **kwargs):
+    if not created:
+        touch_author_projects(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Profile)
+def invalidate_cached_user_profile(sender, instance, **kwargs):
+    invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=Profile)
+def cache_profile_color(sender, instance, **kwargs):
+    cache.set(color_cache_key(instance.user_id), instance.color, COLOR_CACHE_TIMEOUT)
+
+
+@receiver(post_delete, sender=Profile)
+def uncache_profile_color(sender, instance, **kwargs):
+    cache.delete(color_cache_key(instance.user_id))
+
+
+@receiver([post_save, post_delete], sender=ProjectUser)
+def invalidate_project_user(sender, instance, **kwargs):
+    invalidate_project_users(instance.project_id, [instance.user_id])
+
+
+@receiver([post_save, post_delete], sender=ProjectUser)
+def touch_member_project(sender, instance, **kwargs):
+    Project.objects.filter(pk=instance.project_id).touch()
+
+
+@receiver(post_save, sender=Project)
+def invalidate_project(sender, instance, created, **kwargs):
+    if not created:
+        user_ids = instance.get_users().values_list("user_id", flat=True)
+        invalidate_project_users(instance.id, user_ids)
+
+
+@receiver(pre_save, sender=Note)
+def bump_note_version(sender, instance, **kwargs):
+    if instance.pk is not None:
+        instance.version += 1
+
+
+@receiver([post_save, post_delete], sender=Attachment)
+def bump_attachment_note_version(sender, instance, **kwargs):
+    Note.objects.filter(pk=instance.note_id).update(
+        version=F("version") + 1, updated_at=timezone.now()
+    )
+
+
+# Registered before count_saved_note, which resets _loaded_is_completed.
+@receiver(post_save, sender=Note)
+def publish_saved_note(sender, instance, created, **kwargs):
+    loaded = getattr(instance, "_loaded_is_completed", None)
+    if created:
+        event_type = "created"
+    elif loaded is not None and loaded != instance.is_completed:
+        event_type = "completed" if instance.is_completed else "reopened"
+    else:
+        event_type = "updated"
+    publish_note_event(instance.project_id, event_type, [instance.id])
+
+
+@receiver(post_delete, sender=Note)
+def publish_deleted_note(sender, instance, **kwargs):
+    publish_note_event(instance.project_id, "deleted", [instance.id])
+
+
+@receiver(post_save, sender=Attachment)
+def publish_attachment_note(sender, instance, **kwargs):
+    publish_note_event(instance.note.project_id, "updated", [instance.note_id])
+
+
+@receiver(post_save, sender=Note)
+def count_saved_note(sender, instance, created, **kwargs):
+    open_note = 0 if instance.is_completed else 1
+    if created:
+        Project.objects.filter(pk=instance.project_id).adjust_counters(
+            notes=1, open_notes=open_note
+        )
+    else:
+        loaded = getattr(instance, "_loaded_is_completed", None)
+        if loaded is not None and loaded != instance.is_completed:
+            Project.objects.filter(pk=instance.project_id).adjust_counters(
+                open_notes=1 if open_note else -1
+            )
+        else:
+            Project.objects.filter(pk=instance.project_id).touch()
+    instance._loaded_is_completed = instance.is_completed
+
+
+@receiver(post_delete, sender=Note)
+def count_deleted_note(sender, instance, **kwargs):
+    open_note = 0 if instance.is_completed else 1
+    Project.objects.filter(pk=instance.project_id).adjust_counters(
+        notes=-1, open_notes=-open_note
+    )
+
+
+@receiver(post_save, sender=Attachment)
+def count_saved_attachment(sender, instance, created, **kwargs):
+    if created:
+        Project.objects.filter(note__id=instance.note_id).adjust_counters(attachments=1)
+
+
+@receiver(post_delete, sender=Attachment)
+def count_deleted_attachment(sender, instance, **kwargs):
+    Project.objects.filter(note__id=instance.note_id).adjust_counters(attachments=-1)
+
+
+@receiver(post_delete, sender=Attachment)
+def release_blob(sender, instance, **kwargs):
+    Blob.objects.release(instance.blob_id)
+
+
+@receiver(post_delete, sender=ProjectSnapshot)
+def release_snapshot_blobs(sender, instance, **kwargs):
+    for digest, count in instance.blob_references().items():
+        Blob.objects.release(digest, references=count)
+
+
+@receiver(post_delete, sender=Upload)
+def remove_upload_part(sender, instance, **kwargs):
+    def remove():
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+
+    path = instance.path()
+    transaction.on_commit(remove)
+
+
+@receiver(post_save, sender=Project)
+def update_thumbnails(sender, instance, created, **kwargs):
+    if created or instance.image.name != getattr(instance, "_loaded_image", None):
+        try:
+            # Forced, in case a deleted image's name was reused.
+            generate_thumbnails(instance.image, force=True)
+        except OSError:
+            # Missing or unreadable images keep rendering at full size.
+            pass
+    instance._loaded_image = instance.image.name
+
+
+@receiver(post_save, sender=Note)
+def index_saved_note(sender, instance, **kwargs):
+    index_note(instance.id)
+
+
+@receiver(post_delete, sender=Note)
+def unindex_deleted_note(sender, instance, **kwargs):
+    unindex_note(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Attachment)
+def index_attachment_note(sender, instance, **kwargs):
+    index_note(instance.note_id)
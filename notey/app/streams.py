@@ -0,0 +1,107 @@
+import asyncio
+import json
+import re
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import close_old_connections
+from django.http import HttpRequest
+from django.http.cookie import parse_cookie
+
+from .decorators import get_project_user
+from .events import get_broker
+from .models import ProjectUser
+
+EVENTS_PATH = re.compile(r"^/projects/(?P<project_id>\d+)/events$")
+HEARTBEAT_INTERVAL = 15
+
+
+def is_project_member(session_key, project_id):
+    close_old_connections()
+    try:
+        request = HttpRequest()
+        engine = import_module(settings.SESSION_ENGINE)
+        request.session = engine.SessionStore(session_key)
+        user = get_user(request)
+        if not user.is_authenticated:
+            return False
+        try:
+            get_project_user(user, project_id)
+        except ProjectUser.DoesNotExist:
+            return False
+        return True
+    finally:
+        close_old_connections()
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+def format_event(event):
+    return f"event: note\ndata: {json.dumps(event)}\n\n".encode()
+
+
+class NoteEventStream:
+    """
+    Serves /projects/<id>/events as a server-sent event stream of note
+    changes and passes every other request on to the Django application.
+    Streams are served here rather than by a view so that an idle stream
+    holds no thread.
+    """
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        match = scope["type"] == "http" and EVENTS_PATH.match(scope["path"])
+        if not match:
+            return await self.application(scope, receive, send)
+
+        project_id = int(match["project_id"])
+        headers = dict(scope["headers"])
+        cookies = parse_cookie(headers.get(b"cookie", b"").decode("latin1"))
+        session_key = cookies.get(settings.SESSION_COOKIE_NAME)
+        if not session_key or not await sync_to_async(is_project_member)(
+            session_key, project_id
+        ):
+            await send({"type": "http.response.start", "status": 403})
+            await send({"type": "http.response.body"})
+            return
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no"),
+                ],
+            }
+        )
+        disconnect = asyncio.ensure_future(wait_for_disconnect(receive))
+        try:
+            async with get_broker().subscribe(project_id) as events:
+                await self.stream(events, disconnect, send)
+        finally:
+            disconnect.cancel()
+        await send({"type": "http.response.body"})
+
+    async def stream(self, events, disconnect, send):
+        while True:
+            event = asyncio.ensure_future(events.get())
+            done, _ = await asyncio.wait(
+                {event, disconnect},
+                timeout=HEARTBEAT_INTERVAL,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if event not in done:
+                event.cancel()
+            if disconnect in done:
+                return
+            body = format_event(event.result()) if event in done else b":\n\n"
+            await send({"type": "http.response.body", "body": body, "more_body": True})
@@ -0,0 +1,38 @@
+from django import template
+from django.urls import reverse
+
+from ..thumbnails import (
+    THUMBNAIL_SCALES,
+    THUMBNAIL_SIZE,
+    has_thumbnails,
+    thumbnail_name,
+)
+
+register = template.Library()
+
+
+def image_url(project, name):
+    return reverse("app:project_image_file", args=[project.id, name])
+
+
+def thumbnail_srcset(project, extension):
+    return ", ".join(
+        f"{image_url(project, thumbnail_name(project.image.name, scale, extension))} "
+        f"{scale}x"
+        for scale in THUMBNAIL_SCALES
+    )
+
+
+@register.inclusion_tag("includes/project_image.html")
+def project_image(project):
+    image = project.image
+    context = {
+        "src": image_url(project, image.name),
+        "width": THUMBNAIL_SIZE[0],
+        "height": THUMBNAIL_SIZE[1],
+    }
+    if has_thumbnails(image):
+        context["src"] = image_url(project, thumbnail_name(image.name, 1, "jpg"))
+        context["jpeg_srcset"] = thumbnail_srcset(project, "jpg")
+        context["webp_srcset"] = thumbnail_srcset(project, "webp")
+    return context
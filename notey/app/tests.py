@@ -1,11 +1,58 @@
+import asyncio
+import importlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
 import time
+from io import BytesIO, StringIO
+from unittest import mock
 
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY
 from django.contrib.auth.models import User
 from django.contrib.staticfiles.testing import StaticLiveServerTestCase
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection, connections, router, transaction
+from django.db.utils import load_backend
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
 from selenium import webdriver
 from selenium.common.exceptions import NoSuchElementException
 from selenium.webdriver.common.by import By
 
+from . import search
+from .benchmarks import find_regressions, isolated_caches, run_benchmarks, seed_dataset
+from .checks import check_shared_cache
+from .decorators import get_project_user, project_user_cache_key
+from .events import LocalBroker, get_broker
+from .forms import NewUserForm
+from .hashers import PBKDF2PasswordHasher
+from .metrics import MmapValues, collect, record_query
+from .models import (
+    DEFAULT_COLOR,
+    ApiToken,
+    Attachment,
+    Blob,
+    Note,
+    Profile,
+    Project,
+    ProjectSnapshot,
+    ProjectUser,
+    ProjectUserPermission,
+    Upload,
+)
+from .replicas import PIN_COOKIE, ReplicaState, replica_state
+from .streams import NoteEventStream
+from .thumbnails import thumbnail_name
+from .urls import urlpatterns
+
 
 # POMs
 class LoginForm:
@@ -123,6 +170,26 @@ class ProjectForm:
 
 
 # Tests
+# The tests' throwaway objects reuse the ids of real ones, so they must not
+# share the deployment's cache.
+isolated_caches_override = isolated_caches()
+
+
+def isolate_caches(test):
+    # Fresh stores, as the ids of the test's objects are reused.
+    settings_override = isolated_caches()
+    settings_override.enable()
+    test.addCleanup(settings_override.disable)
+
+
+def setUpModule():
+    isolated_caches_override.enable()
+
+
+def tearDownModule():
+    isolated_caches_override.disable()
+
+
 class SeleniumTestCase(StaticLiveServerTestCase):
     @classmethod
     def setUpClass(cls):
@@ -275,3 +342,1363 @@ class ProjectFormTest(SeleniumTestCase):
         project_form.create_project(project_name)
 
         self.assertTrue(project_form.form_error_exists())
+
+
+class ProjectQuerySetTest(TestCase):
+    USERNAME = "testuser"
+    EMAIL = "testuser@example.com"
+    PASSWORD = "testpassword"
+
+    def setUp(self):
+        self.user = User.objects.create_user(self.USERNAME, self.EMAIL, self.PASSWORD)
+        other = User.objects.create_user("otheruser", "other@example.com", "pass")
+        for i in range(5):
+            project = Project.objects.create(
+                creator=self.user, name=f"Project {i}", is_archived=i % 2 == 1
+            )
+            ProjectUser.objects.create(
+                project=project, user=self.user, permission=ProjectUserPermission.DELETE
+            )
+        Project.objects.create(creator=other, name="Not mine")
+
+    def test_visible_to(self):
+        with self.assertNumQueries(1):
+            active = [p.name for p in Project.objects.visible_to(self.user)]
+        with self.assertNumQueries(1):
+            archived = [
+                p.name for p in Project.objects.visible_to(self.user, archived=True)
+            ]
+
+        self.assertEqual(active, ["Project 0", "Project 2", "Project 4"])
+        self.assertEqual(archived, ["Project 1", "Project 3"])
+
+    def test_projects_view_query_count(self):
+        self.client.login(username=self.USERNAME, password=self.PASSWORD)
+
+        # user (uncached after login), marker, count, page
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("app:projects"))
+
+        self.assertEqual(len(response.context["projects"]), 3)
+
+
+class ProjectTestCase(TestCase):
+    USERNAME = "testuser"
+    EMAIL = "testuser@example.com"
+    PASSWORD = "testpassword"
+
+    def setUp(self):
+        isolate_caches(self)
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(self.USERNAME, self.EMAIL, self.PASSWORD)
+        self.authors = [
+            User.objects.create_user(f"author{i}", f"author{i}@example.com", "pass")
+            for i in range(3)
+        ]
+        self.project = Project.objects.create(creator=self.user, name="Test project")
+        ProjectUser.objects.create(
+            project=self.project,
+            user=self.user,
+            permission=ProjectUserPermission.DELETE,
+        )
+        self.client.login(username=self.USERNAME, password=self.PASSWORD)
+
+    def add_notes(self, count):
+        for i in range(count):
+            note = Note.objects.create(
+                text=f"Note {i}",
+                user=self.authors[i % len(self.authors)],
+                project=self.project,
+                is_completed=i % 2 == 0,
+            )
+            Attachment.objects.create_from_file(
+                note, ContentFile(f"Attachment {i}".encode(), name=f"{i}.txt")
+            )
+
+
+class NoteQueryBudgetTest(ProjectTestCase):
+    # notes, attachments
+    PROJECT_DETAILS_QUERY_BUDGET = 2
+
+    def assertQueryBudget(self, url_name, budget=PROJECT_DETAILS_QUERY_BUDGET):
+        url = reverse(url_name, args=[self.project.id])
+        self.client.get(url)
+        for count in (5, 50):
+            self.add_notes(count)
+            with self.assertNumQueries(budget):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_project_details_query_budget(self):
+        # and the change marker
+        self.assertQueryBudget(
+            "app:project_details", self.PROJECT_DETAILS_QUERY_BUDGET + 1
+        )
+
+    def test_archive_project_details_query_budget(self):
+        url = reverse("app:archive_project_details", args=[self.project.id])
+        for count, total in ((5, 5), (50, 55)):
+            self.client.get(reverse("app:unarchive_project", args=[self.project.id]))
+            self.add_notes(count)
+            self.client.get(reverse("app:archive_project", args=[self.project.id]))
+            self.client.get(url)
+            # the snapshot
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertEqual(len(response.context["notes"]), total)
+
+
+class NoteFeedTest(ProjectTestCase):
+    def test_keyset_pages(self):
+        self.add_notes(120)
+
+        response = self.client.get(
+            reverse("app:project_details", args=[self.project.id])
+        )
+        notes = response.context["notes"]
+        self.assertEqual([note.text for note in notes[:2]], ["Note 119", "Note 118"])
+        self.assertEqual(len(notes), 50)
+
+        seen = [note.id for note in notes]
+        next_cursor = response.context["next_cursor"]
+        while next_cursor:
+            response = self.client.get(
+                reverse("app:project_notes", args=[self.project.id]),
+                {"before": next_cursor},
+            )
+            seen += [note.id for note in response.context["notes"]]
+            next_cursor = response.context["next_cursor"]
+
+        expected = list(
+            self.project.get_notes().order_by("-id").values_list("id", flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+
+class ProjectMemberCacheTest(ProjectTestCase):
+    def test_cached_membership(self):
+        get_project_user(self.user, self.project.id)
+
+        with self.assertNumQueries(0):
+            project_user = get_project_user(self.user, self.project.id)
+
+        self.assertEqual(project_user.project, self.project)
+        self.assertTrue(project_user.can_delete)
+
+    def test_invalidated_on_save(self):
+        project_user = get_project_user(self.user, self.project.id)
+        project_user.permission = ProjectUserPermission.READ
+        project_user.save()
+
+        project_user = get_project_user(self.user, self.project.id)
+
+        self.assertFalse(project_user.can_write)
+
+    def test_invalidated_on_delete(self):
+        url = reverse("app:project_details", args=[self.project.id])
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.client.get(reverse("app:leave_project", args=[self.project.id]))
+
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_invalidated_again_on_commit(self):
+        project_user = get_project_user(self.user, self.project.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ProjectUser.objects.get(pk=project_user.pk).delete()
+            # Another request, reading before the delete commits.
+            cache.set(
+                project_user_cache_key(self.user.id, self.project.id), project_user
+            )
+
+        with self.assertRaises(ProjectUser.DoesNotExist):
+            get_project_user(self.user, self.project.id)
+
+
+class ProjectCounterTest(ProjectTestCase):
+    def assertCounters(self, notes, open_notes, attachments):
+        self.project.refresh_counters()
+        self.assertEqual(
+            [
+                self.project.note_count,
+                self.project.open_note_count,
+                self.project.attachment_count,
+            ],
+            [notes, open_notes, attachments],
+        )
+
+    def test_counters_follow_note_changes(self):
+        self.add_notes(4)
+        self.assertCounters(4, 2, 4)
+        self.assertFalse(self.project.is_archiveable)
+
+        note = self.project.get_notes().filter(is_completed=False).first()
+        self.client.get(reverse("app:complete_note", args=[self.project.id, note.id]))
+        self.assertCounters(4, 1, 4)
+
+        self.client.get(reverse("app:delete_note", args=[self.project.id, note.id]))
+        self.assertCounters(3, 1, 3)
+
+        self.project.get_notes().filter(is_completed=False).delete()
+        self.assertCounters(2, 0, 2)
+        self.assertTrue(self.project.is_archiveable)
+
+    def test_settings_keep_concurrent_counter_changes(self):
+        refresh_counters = Project.refresh_counters
+
+        def refresh_then_add_note(project):
+            refresh_counters(project)
+            # A note added by another request after the counters were read.
+            Project.objects.filter(pk=project.pk).adjust_counters(notes=1)
+
+        with mock.patch.object(Project, "refresh_counters", refresh_then_add_note):
+            self.client.post(
+                reverse("app:project_settings", args=[self.project.id]),
+                {"name": "Renamed"},
+            )
+
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.name, "Renamed")
+        self.assertEqual(self.project.note_count, 1)
+
+    def test_rebuild_command(self):
+        self.add_notes(3)
+        Project.objects.filter(pk=self.project.pk).update(
+            note_count=0, open_note_count=7
+        )
+        out = StringIO()
+
+        call_command("rebuild_project_counters", "--check", stdout=out)
+        self.assertIn("1 project(s)", out.getvalue())
+        self.assertCounters(0, 7, 3)
+
+        call_command("rebuild_project_counters", stdout=out)
+        self.assertCounters(3, 1, 3)
+
+
+class ChunkedUploadTest(ProjectTestCase):
+    PAYLOAD = b"0123456789" * 1000
+
+    def send_chunk(self, url, offset, chunk):
+        return self.client.patch(
+            url,
+            chunk,
+            content_type="application/octet-stream",
+            HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_resumable_upload(self):
+        response = self.client.post(
+            reverse("app:new_upload", args=[self.project.id]),
+            {"filename": "spec.pdf", "size": len(self.PAYLOAD)},
+        )
+        self.assertEqual(response.status_code, 201)
+        url = response.json()["url"]
+
+        self.send_chunk(url, 0, self.PAYLOAD[:4000])
+        response = self.send_chunk(url, 0, self.PAYLOAD[:4000])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["offset"], 4000)
+
+        response = self.send_chunk(url, 4000, self.PAYLOAD[4000:])
+        upload = Upload.objects.get(pk=response.json()["id"])
+        self.assertTrue(upload.is_complete)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("app:new_note", args=[self.project.id]),
+                {"text": "With upload", "upload": [upload.id]},
+            )
+
+        attachment = Attachment.objects.get(note__text="With upload")
+        with attachment.file.open("rb") as file:
+            self.assertEqual(file.read(), self.PAYLOAD)
+        self.assertEqual(attachment.filename(), "spec.pdf")
+        self.assertFalse(Upload.objects.exists())
+        self.assertFalse(os.path.exists(upload.path()))
+
+    def test_incomplete_upload_is_not_attached(self):
+        upload = Upload.objects.create(
+            user=self.user, project=self.project, filename="a.txt", size=10
+        )
+
+        response = self.client.post(
+            reverse("app:new_note", args=[self.project.id]),
+            {"text": "Too early", "upload": [upload.id]},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Note.objects.filter(text="Too early").exists())
+
+    def test_chunk_for_a_moved_offset_is_rejected(self):
+        upload = Upload.objects.create(
+            user=self.user, project=self.project, filename="a.txt", size=10
+        )
+        # Another request, which wrote a chunk after this one read the upload.
+        stale = Upload.objects.get(pk=upload.pk)
+        upload.write_chunk(BytesIO(b"01234"), 0, 5)
+
+        self.assertFalse(stale.write_chunk(BytesIO(b"abcde"), 0, 5))
+        self.assertEqual(stale.offset, 5)
+        with open(upload.path(), "rb") as part:
+            self.assertEqual(part.read(), b"01234")
+
+    def test_stale_and_orphaned_parts_are_deleted(self):
+        stale, fresh = [
+            Upload.objects.create(
+                user=self.user, project=self.project, filename="a.txt", size=10
+            )
+            for _ in range(2)
+        ]
+        for upload in (stale, fresh):
+            upload.write_chunk(BytesIO(b"01234"), 0, 5)
+        Upload.objects.filter(pk=stale.pk).update(
+            updated_at=timezone.now() - Upload.EXPIRES_AFTER
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("delete_stale_uploads", stdout=StringIO())
+        self.assertEqual(list(Upload.objects.all()), [fresh])
+        self.assertFalse(os.path.exists(stale.path()))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.project.delete()
+        self.assertFalse(os.path.exists(fresh.path()))
+
+
+class BlobStorageTest(ProjectTestCase):
+    def test_identical_payloads_share_a_blob(self):
+        self.add_notes(2)
+        first, second = self.project.get_notes()
+        spec = Attachment.objects.create_from_file(
+            first, ContentFile(b"spec", name="spec.pdf")
+        )
+        copy = Attachment.objects.create_from_file(
+            second, ContentFile(b"spec", name="copy.pdf")
+        )
+
+        self.assertEqual(spec.blob_id, copy.blob_id)
+        self.assertEqual(copy.filename(), "copy.pdf")
+        self.assertEqual(Blob.objects.get(pk=spec.blob_id).ref_count, 2)
+
+        first.delete()
+        blob = Blob.objects.get(pk=spec.blob_id)
+        self.assertEqual(blob.ref_count, 1)
+        self.assertTrue(blob.file.storage.exists(blob.file.name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+            self.assertFalse(Blob.objects.filter(pk=spec.blob_id).exists())
+            self.assertTrue(blob.file.storage.exists(blob.file.name))
+        self.assertFalse(blob.file.storage.exists(blob.file.name))
+
+    def test_rolled_back_release_keeps_the_file(self):
+        self.add_notes(1)
+        attachment = Attachment.objects.get()
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            attachment.note.delete()
+            raise RuntimeError
+
+        self.assertTrue(Blob.objects.filter(pk=attachment.blob_id).exists())
+        self.assertTrue(attachment.file.storage.exists(attachment.file.name))
+
+
+class ThumbnailTest(ProjectTestCase):
+    def image_file(self, name):
+        buffer = BytesIO()
+        Image.new("RGB", (1600, 900), "teal").save(buffer, "JPEG")
+        return ContentFile(buffer.getvalue(), name=name)
+
+    def test_thumbnails_generated_on_image_change(self):
+        self.project.image = self.image_file("cover.jpg")
+        self.project.save()
+        storage = self.project.image.storage
+
+        for scale, size in [(1, (288, 192)), (2, (576, 384))]:
+            for extension in ["jpg", "webp"]:
+                name = thumbnail_name(self.project.image.name, scale, extension)
+                with Image.open(storage.open(name)) as thumbnail:
+                    self.assertEqual(thumbnail.size, size)
+
+        response = self.client.get(reverse("app:projects"))
+        self.assertContains(response, "cover.jpg-576x384.webp 2x")
+
+    def test_same_base_names_get_separate_thumbnails(self):
+        storage = self.project.image.storage
+        names = [
+            storage.save(f"images/projects/{name}", self.image_file(name))
+            for name in ("a/logo.jpg", "b/logo.png")
+        ]
+        thumbnails = {thumbnail_name(name, 1, "jpg") for name in names}
+        self.assertEqual(len(thumbnails), 2)
+
+    def test_backfill_command(self):
+        Project.objects.filter(pk=self.project.pk).update(
+            image=self.project.image.storage.save(
+                "images/projects/old.jpg", self.image_file("old.jpg")
+            )
+        )
+        out = StringIO()
+
+        call_command("generate_thumbnails", stdout=out, stderr=StringIO())
+
+        self.assertIn("1 image(s) processed.", out.getvalue())
+        self.project.refresh_from_db()
+        self.assertTrue(
+            self.project.image.storage.exists(
+                thumbnail_name(self.project.image.name, 2, "webp")
+            )
+        )
+
+
+class MediaServingTest(ProjectTestCase):
+    PAYLOAD = b"0123456789abcdef"
+
+    def setUp(self):
+        super().setUp()
+        note = Note.objects.create(text="Note", user=self.user, project=self.project)
+        self.attachment = Attachment.objects.create_from_file(
+            note, ContentFile(self.PAYLOAD, name="data.bin")
+        )
+        self.url = reverse(
+            "app:attachment_file", args=[self.project.id, self.attachment.id]
+        )
+
+    def test_full_and_conditional_responses(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.PAYLOAD)
+        self.assertEqual(response["ETag"], f'"{self.attachment.blob_id}"')
+        self.assertIn("Last-Modified", response)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_range_requests(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=2-5")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 2-5/16")
+        self.assertEqual(b"".join(response.streaming_content), b"2345")
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=-3")
+        self.assertEqual(b"".join(response.streaming_content), b"def")
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=16-")
+        self.assertEqual(response.status_code, 416)
+
+        response = self.client.get(
+            self.url, HTTP_RANGE="bytes=2-5", HTTP_IF_RANGE='"stale"'
+        )
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(MEDIA_SENDFILE_HEADER="X-Accel-Redirect")
+    def test_accel_redirect(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.content, b"")
+        self.assertEqual(
+            response["X-Accel-Redirect"],
+            f"/protected-media/{self.attachment.file.name}",
+        )
+
+    def test_only_safe_types_are_inline(self):
+        note = self.attachment.note
+        for name, content_type, disposition in (
+            ("evil.html", "application/octet-stream", "attachment"),
+            ("evil.svg", "application/octet-stream", "attachment"),
+            ("photo.png", "image/png", "inline"),
+        ):
+            attachment = Attachment.objects.create_from_file(
+                note, ContentFile(b"<script>alert(1)</script>", name=name)
+            )
+            response = self.client.get(
+                reverse("app:attachment_file", args=[self.project.id, attachment.id])
+            )
+            self.assertEqual(response["Content-Type"], content_type)
+            self.assertTrue(response["Content-Disposition"].startswith(disposition))
+            self.assertEqual(response["X-Content-Type-Options"], "nosniff")
+            self.assertEqual(response["Content-Security-Policy"], "sandbox")
+
+    def test_non_members_are_refused(self):
+        User.objects.create_user("outsider", "outsider@example.com", "pass")
+        self.client.login(username="outsider", password="pass")
+
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class NoteCardCacheTest(ProjectTestCase):
+    def test_cards_refresh_when_note_changes(self):
+        self.add_notes(1)
+        note = self.project.get_notes().get()
+        url = reverse("app:project_details", args=[self.project.id])
+        self.assertContains(self.client.get(url), "Note 0")
+
+        Note.objects.filter(pk=note.pk).update(text="Unversioned edit")
+        self.assertContains(self.client.get(url), "Note 0")
+
+        note.text = "Saved edit"
+        note.save()
+        self.assertContains(self.client.get(url), "Saved edit")
+
+        Attachment.objects.create_from_file(note, ContentFile(b"late", name="late.txt"))
+        self.assertContains(self.client.get(url), "late.txt")
+
+        profile = note.user.profile
+        profile.color = "#123456"
+        profile.save()
+        self.assertContains(self.client.get(url), "#1234560C")
+
+    def test_cards_vary_on_permission(self):
+        self.add_notes(1)
+        url = reverse("app:project_details", args=[self.project.id])
+        self.assertContains(self.client.get(url), "Delete")
+
+        project_user = ProjectUser.objects.get(user=self.user)
+        project_user.permission = ProjectUserPermission.READ
+        project_user.save()
+
+        self.assertNotContains(self.client.get(url), "Delete")
+
+
+class NoteSearchTest(ProjectTestCase):
+    def setUp(self):
+        super().setUp()
+        other = User.objects.create_user("otheruser", "other@example.com", "pass")
+        hidden = Project.objects.create(creator=other, name="Hidden project")
+        Note.objects.create(text="Quarterly budget review", user=other, project=hidden)
+
+    def search(self, query):
+        response = self.client.get(reverse("app:search"), {"q": query})
+        return [result["note_id"] for result in response.context["results"]]
+
+    def test_search_is_scoped_and_synced(self):
+        note = Note.objects.create(
+            text="Draft the quarterly <b>budget</b>",
+            user=self.user,
+            project=self.project,
+        )
+        self.assertEqual(self.search("budg"), [note.id])
+
+        response = self.client.get(reverse("app:search"), {"q": "budget"})
+        self.assertContains(response, "&lt;b&gt;<mark>budget</mark>&lt;/b&gt;")
+
+        Attachment.objects.create_from_file(
+            note, ContentFile(b"pdf", name="roadmap.pdf")
+        )
+        self.assertEqual(self.search("roadmap"), [note.id])
+
+        note.text = "Nothing left here"
+        note.save()
+        self.assertEqual(self.search("budget"), [])
+
+        note.delete()
+        self.assertEqual(self.search("roadmap"), [])
+
+    def test_query_syntax_is_escaped(self):
+        Note.objects.create(
+            text='Say "hi" OR NOT', user=self.user, project=self.project
+        )
+
+        self.assertEqual(len(self.search('"hi" OR NOT (')), 1)
+
+    def test_project_ids_are_not_searchable(self):
+        Note.objects.create(text="Nothing", user=self.user, project=self.project)
+
+        self.assertEqual(self.search(str(self.project.id)), [])
+
+    def test_rebuild_command(self):
+        self.add_notes(3)
+        out = StringIO()
+
+        call_command("rebuild_search_index", stdout=out)
+
+        self.assertIn("4 note(s) indexed.", out.getvalue())
+        self.assertEqual(len(self.search("Note")), 3)
+
+
+class NoteApiTest(ProjectTestCase):
+    def setUp(self):
+        super().setUp()
+        _, key = ApiToken.objects.create_for(self.user)
+        self.api_client = Client(
+            enforce_csrf_checks=True, HTTP_AUTHORIZATION=f"Bearer {key}"
+        )
+
+    def post_json(self, url_name, data):
+        return self.api_client.post(
+            reverse(url_name, args=[self.project.id]),
+            json.dumps(data),
+            content_type="application/json",
+        )
+
+    def assertCounters(self, notes, open_notes, attachments):
+        self.project.refresh_counters()
+        self.assertEqual(
+            [
+                self.project.note_count,
+                self.project.open_note_count,
+                self.project.attachment_count,
+            ],
+            [notes, open_notes, attachments],
+        )
+
+    def test_bulk_create(self):
+        # token, membership, savepoint, insert, counters, index (2), release
+        with self.assertNumQueries(8):
+            response = self.post_json(
+                "app:api_notes", {"notes": [{"text": f"Bulk {i}"} for i in range(50)]}
+            )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()["ids"]), 50)
+        self.assertCounters(50, 50, 0)
+
+        response = self.client.get(reverse("app:search"), {"q": "Bulk"})
+        self.assertEqual(len(response.context["results"]), 20)
+
+        response = self.api_client.get(reverse("app:api_notes", args=[self.project.id]))
+        self.assertEqual(response.json()["notes"][0]["text"], "Bulk 49")
+
+    def test_requests_need_a_token(self):
+        url = reverse("app:api_notes", args=[self.project.id])
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json(), {"error": "Authentication required."})
+        response = Client(HTTP_AUTHORIZATION="Bearer wrong").get(url)
+        self.assertEqual(response.status_code, 401)
+
+        other = Project.objects.create(creator=self.user, name="Other project")
+        response = self.api_client.get(reverse("app:api_notes", args=[other.id]))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {"error": "Project not found."})
+
+    def test_is_completed_must_be_boolean(self):
+        self.add_notes(2)
+        ids = list(self.project.get_notes().values_list("id", flat=True))
+
+        response = self.post_json(
+            "app:api_notes", {"notes": [{"text": "Done", "is_completed": "false"}]}
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.post_json(
+            "app:api_complete_notes", {"ids": ids, "is_completed": "false"}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertCounters(2, 1, 2)
+
+    def test_bulk_complete_and_delete(self):
+        self.add_notes(6)
+        ids = list(self.project.get_notes().values_list("id", flat=True))
+        blob_ids = list(Attachment.objects.values_list("blob_id", flat=True))
+
+        response = self.post_json("app:api_complete_notes", {"ids": ids})
+        self.assertEqual(response.json(), {"updated": 3})
+        self.assertCounters(6, 0, 6)
+
+        response = self.post_json(
+            "app:api_complete_notes", {"ids": ids[:2], "is_completed": False}
+        )
+        self.assertEqual(response.json(), {"updated": 2})
+        self.assertCounters(6, 2, 6)
+
+        response = self.post_json("app:api_delete_notes", {"ids": ids[:4]})
+        self.assertEqual(response.json(), {"deleted": 4})
+        self.assertCounters(2, 0, 2)
+        self.assertEqual(Blob.objects.filter(pk__in=blob_ids).count(), 2)
+
+        response = self.client.get(reverse("app:search"), {"q": "Note"})
+        self.assertEqual(len(response.context["results"]), 2)
+
+    def test_bulk_actions_respect_permissions(self):
+        self.add_notes(2)
+        ids = list(self.project.get_notes().values_list("id", flat=True))
+        project_user = ProjectUser.objects.get(user=self.user)
+        project_user.permission = ProjectUserPermission.WRITE
+        project_user.save()
+
+        response = self.post_json("app:api_complete_notes", {"ids": ids})
+        self.assertEqual(response.status_code, 403)
+        response = self.post_json("app:api_delete_notes", {"ids": ids})
+        self.assertEqual(response.status_code, 403)
+        response = self.post_json(
+            "app:api_notes", {"notes": [{"text": "Done", "is_completed": True}]}
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.project.get_notes().count(), 2)
+
+        response = self.post_json(
+            "app:api_notes", {"notes": [{"text": "Open", "is_completed": False}]}
+        )
+        self.assertEqual(response.status_code, 201)
+
+    def test_other_projects_notes_are_untouched(self):
+        other = Project.objects.create(creator=self.user, name="Other project")
+        note = Note.objects.create(text="Keep", user=self.user, project=other)
+
+        response = self.post_json("app:api_delete_notes", {"ids": [note.id]})
+
+        self.assertEqual(response.json(), {"deleted": 0})
+        self.assertTrue(Note.objects.filter(pk=note.pk).exists())
+
+
+class BulkNoteActionTest(ProjectTestCase):
+    def post_action(self, action, ids):
+        return self.client.post(
+            reverse("app:bulk_notes", args=[self.project.id]),
+            {"action": action, "note": ids},
+        )
+
+    def test_complete_reopen_and_delete(self):
+        self.add_notes(4)
+        ids = list(self.project.get_notes().values_list("id", flat=True))
+
+        response = self.post_action("complete", ids)
+        self.assertRedirects(
+            response, reverse("app:project_details", args=[self.project.id])
+        )
+        self.assertFalse(self.project.get_notes().filter(is_completed=False).exists())
+
+        self.post_action("reopen", ids[:2])
+        self.assertEqual(self.project.get_notes().filter(is_completed=False).count(), 2)
+
+        self.post_action("delete", ids[:3])
+        self.assertEqual(
+            list(self.project.get_notes().values_list("id", flat=True)), ids[3:]
+        )
+        self.project.refresh_counters()
+        self.assertEqual(self.project.note_count, 1)
+
+    def test_permissions_are_checked_in_the_statement(self):
+        self.add_notes(2)
+        ids = list(self.project.get_notes().values_list("id", flat=True))
+        self.client.get(reverse("app:project_details", args=[self.project.id]))
+        # Bypass the signals, so the cached membership still allows deleting.
+        ProjectUser.objects.filter(user=self.user).update(
+            permission=ProjectUserPermission.WRITE
+        )
+
+        self.post_action("delete", ids)
+        self.post_action("complete", ids)
+
+        self.assertEqual(self.project.get_notes().count(), 2)
+        self.assertEqual(self.project.get_notes().filter(is_completed=False).count(), 1)
+
+    def test_invalid_selection_changes_nothing(self):
+        self.add_notes(2)
+
+        self.post_action("delete", ["x"])
+        self.post_action("archive", [])
+
+        self.assertEqual(self.project.get_notes().count(), 2)
+
+
+class AsyncViewTest(ProjectTestCase):
+    def test_pages_render(self):
+        self.add_notes(3)
+        for url in (
+            reverse("app:projects"),
+            reverse("app:archive"),
+            reverse("app:project_details", args=[self.project.id]),
+            reverse("app:archive_project_details", args=[self.project.id]),
+        ):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+
+    def test_access_is_checked(self):
+        other = Project.objects.create(creator=self.authors[0], name="Other project")
+        response = self.client.get(reverse("app:project_details", args=[other.id]))
+        self.assertEqual(response.status_code, 404)
+
+        self.client.logout()
+        for url in (
+            reverse("app:archive"),
+            reverse("app:project_details", args=[self.project.id]),
+        ):
+            response = self.client.get(url)
+            self.assertRedirects(response, f"{reverse('app:login')}?next={url}")
+
+
+class NoteEventTest(ProjectTestCase):
+    def setUp(self):
+        super().setUp()
+        self.events = []
+        broker = get_broker()
+        publish = broker.publish
+        broker.publish = lambda project_id, event: self.events.append(
+            (project_id, event)
+        )
+        self.addCleanup(setattr, broker, "publish", publish)
+
+    def test_note_changes_are_published(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            note = Note.objects.create(
+                text="Live", user=self.user, project=self.project
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            note.is_completed = True
+            note.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            note.delete()
+
+        self.assertEqual(
+            [(project_id, event["type"]) for project_id, event in self.events],
+            [(self.project.id, "created"), (self.project.id, "completed")]
+            + [(self.project.id, "deleted")],
+        )
+
+    def test_bulk_changes_are_published_once(self):
+        self.add_notes(4)
+        ids = list(self.project.get_notes().values_list("id", flat=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.project.get_notes().set_completed(True)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.project.get_notes().delete_in_bulk()
+
+        self.assertEqual(
+            self.events,
+            [
+                (self.project.id, {"type": "completed", "ids": ids[1::2]}),
+                (self.project.id, {"type": "deleted", "ids": ids}),
+            ],
+        )
+
+    def test_cards_by_id(self):
+        self.add_notes(3)
+        ids = list(self.project.get_notes().values_list("id", flat=True))
+        response = self.client.get(
+            reverse("app:project_notes", args=[self.project.id]),
+            {"ids": f"{ids[0]},{ids[2]}"},
+        )
+        self.assertEqual(
+            [note.id for note in response.context["notes"]], [ids[2], ids[0]]
+        )
+        self.assertIsNone(response.context["next_cursor"])
+
+    def test_page_opens_one_event_stream(self):
+        response = self.client.get(
+            reverse("app:project_details", args=[self.project.id])
+        )
+        self.assertEqual(response.content.decode().count("new EventSource("), 1)
+
+
+class NoteEventStreamTest(ProjectTestCase):
+    def scope(self, cookie=""):
+        return {
+            "type": "http",
+            "path": f"/projects/{self.project.id}/events",
+            "headers": [(b"cookie", cookie.encode())],
+        }
+
+    async def test_local_broker_delivers_across_threads(self):
+        broker = LocalBroker()
+        async with broker.subscribe(1) as events:
+            thread = threading.Thread(
+                target=broker.publish, args=(1, {"type": "created", "ids": [5]})
+            )
+            thread.start()
+            event = await asyncio.wait_for(events.get(), 5)
+            thread.join()
+
+        self.assertEqual(event, {"type": "created", "ids": [5]})
+        self.assertEqual(broker.subscribers, {})
+
+    async def test_stream(self):
+        cookie = f"sessionid={self.client.cookies['sessionid'].value}"
+        messages = []
+        disconnected = asyncio.Event()
+
+        async def receive():
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            messages.append(message)
+            if message.get("body"):
+                disconnected.set()
+
+        stream = asyncio.ensure_future(
+            NoteEventStream(None)(self.scope(cookie), receive, send)
+        )
+        while self.project.id not in get_broker().subscribers:
+            await asyncio.sleep(0.01)
+        get_broker().publish(self.project.id, {"type": "created", "ids": [7]})
+        await asyncio.wait_for(stream, 5)
+
+        self.assertEqual(messages[0]["status"], 200)
+        self.assertEqual(
+            messages[1]["body"],
+            b'event: note\ndata: {"type": "created", "ids": [7]}\n\n',
+        )
+
+    async def test_non_members_are_refused(self):
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        await NoteEventStream(None)(self.scope(), None, send)
+        self.assertEqual(messages[0]["status"], 403)
+
+
+class ConditionalPageTest(ProjectTestCase):
+    def get(self, url, etag=None):
+        headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        return self.client.get(url, **headers)
+
+    def assertNotModified(self, url):
+        self.get(url)
+        etag = self.get(url)["ETag"]
+        response = self.get(url, etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertIn("no-cache", response["Cache-Control"])
+        return etag
+
+    def test_project_details(self):
+        url = reverse("app:project_details", args=[self.project.id])
+        self.add_notes(2)
+        etag = self.assertNotModified(url)
+
+        # marker
+        with self.assertNumQueries(1):
+            self.get(url, etag)
+
+        note = self.project.get_notes().first()
+        note.is_completed = not note.is_completed
+        note.save()
+        response = self.get(url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_project_details_follows_authors(self):
+        url = reverse("app:project_details", args=[self.project.id])
+        self.add_notes(1)
+        author = self.project.get_notes().get().user
+
+        etag = self.assertNotModified(url)
+        profile = author.profile
+        profile.color = "#123456"
+        profile.save(update_fields=["color"])
+        self.assertEqual(self.get(url, etag).status_code, 200)
+
+        etag = self.assertNotModified(url)
+        author.username = "renamed"
+        author.save()
+        self.assertContains(self.get(url, etag), "@renamed")
+
+    def test_projects_and_archive(self):
+        other = Project.objects.create(creator=self.authors[0], name="Other project")
+        for url_name, is_archived in (("app:projects", False), ("app:archive", True)):
+            other.is_archived = is_archived
+            other.save()
+            url = reverse(url_name)
+            etag = self.assertNotModified(url)
+            member = ProjectUser.objects.create(project=other, user=self.user)
+            self.assertEqual(self.get(url, etag).status_code, 200)
+            member.delete()
+
+    def test_timestamps(self):
+        self.add_notes(1)
+        note = self.project.get_notes().get()
+        self.project.refresh_from_db()
+        self.assertIsNotNone(note.created_at)
+        self.assertGreaterEqual(self.project.changed_at, note.updated_at)
+
+
+class QueryPlanTest(TestCase):
+    def test_hot_queries_use_indexes(self):
+        out = StringIO()
+        call_command("check_query_plans", stdout=out)
+        self.assertIn("No full scans", out.getvalue())
+
+    def test_duplicate_email_ignores_case(self):
+        User.objects.create_user("existing", "Someone@Example.com", "pass")
+        form = NewUserForm(
+            {
+                "username": "newuser",
+                "email": "someone@example.COM",
+                "password1": "a-Long-password-1",
+                "password2": "a-Long-password-1",
+            }
+        )
+        self.assertIn("email", form.errors)
+
+
+class ViewBenchmarkTest(ProjectTestCase):
+    def test_every_route_is_measured(self):
+        seed = seed_dataset(users=2, projects=2, notes=3, attachments=1)
+        results = run_benchmarks(seed, repeat=1)
+
+        self.assertEqual(set(results), {pattern.name for pattern in urlpatterns})
+        for name, result in results.items():
+            self.assertLess(result["status"], 500, name)
+            self.assertGreater(result["queries"], 0, name)
+        self.assertEqual(results["api_notes"]["status"], 200)
+        # Routes run in rolled back transactions.
+        self.assertEqual(Project.objects.filter(name__startswith="Project ").count(), 2)
+
+    def test_regressions(self):
+        baseline = {"projects": {"time_ms": 10.0, "queries": 5, "peak_kb": 100.0}}
+        results = {"projects": {"time_ms": 11.5, "queries": 5, "peak_kb": 110.0}}
+        self.assertEqual(find_regressions(results, baseline, threshold=0.2), [])
+
+        results["projects"].update(time_ms=13.0, queries=6)
+        self.assertEqual(
+            find_regressions(results, baseline, threshold=0.2),
+            ["projects: 5 -> 6 queries", "projects: 10.0 -> 13.0 ms"],
+        )
+
+
+class MetricsTest(ProjectTestCase):
+    def scrape(self):
+        response = self.client.get(reverse("app:metrics"))
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if not line.startswith("#"):
+                key, value = line.rsplit(" ", 1)
+                samples[key] = float(value)
+        return samples
+
+    def test_requests_are_recorded(self):
+        key = (
+            'notey_requests_total{view="app:project_details",method="GET",status="200"}'
+        )
+        before = self.scrape()
+        self.client.get(reverse("app:project_details", args=[self.project.id]))
+        after = self.scrape()
+
+        self.assertEqual(after[key] - before.get(key, 0), 1)
+        view = 'view="app:project_details"'
+        for name in (
+            "notey_request_duration_seconds_count",
+            "notey_db_queries_sum",
+            "notey_db_query_duration_seconds_total",
+            "notey_template_render_seconds_total",
+            "notey_response_bytes_sum",
+        ):
+            self.assertGreater(after[f"{name}{{{view}}}"], before.get(name, 0), name)
+        self.assertEqual(
+            after[f'notey_db_queries_bucket{{{view},le="+Inf"}}'],
+            after[f"notey_db_queries_count{{{view}}}"],
+        )
+
+    def test_scrapes_are_restricted(self):
+        response = self.client.get(reverse("app:metrics"), REMOTE_ADDR="192.0.2.1")
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_scrapes_need_the_token_when_set(self):
+        url = reverse("app:metrics")
+        self.assertEqual(self.client.get(url).status_code, 403)
+        response = self.client.get(url, HTTP_AUTHORIZATION="Bearer wrong")
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(
+            url, REMOTE_ADDR="192.0.2.1", HTTP_AUTHORIZATION="Bearer secret"
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_reconnects_record_queries_once(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        name = os.path.join(directory.name, "db.sqlite3")
+        other = load_backend(connection.settings_dict["ENGINE"]).DatabaseWrapper(
+            {**connection.settings_dict, "NAME": name}, "other"
+        )
+        for _ in range(3):
+            other.ensure_connection()
+            other.close()
+
+        self.assertEqual(other.execute_wrappers, [record_query])
+
+    def test_worker_files_are_aggregated(self):
+        metrics_dir = tempfile.mkdtemp(dir=settings.MEDIA_ROOT)
+        first = MmapValues(os.path.join(metrics_dir, "1.db"))
+        second = MmapValues(os.path.join(metrics_dir, "2.db"))
+        first.inc('notey_requests_total{view="a"}', 2)
+        second.inc('notey_requests_total{view="a"}', 3)
+        # Grow the file past its initial size.
+        for i in range(2000):
+            second.inc(f'notey_requests_total{{view="view{i}"}}', i)
+
+        with override_settings(METRICS_DIR=metrics_dir):
+            values = collect()
+        self.assertEqual(values['notey_requests_total{view="a"}'], 5)
+        self.assertEqual(values['notey_requests_total{view="view1999"}'], 1999)
+
+        reopened = MmapValues(os.path.join(metrics_dir, "1.db"))
+        reopened.inc('notey_requests_total{view="a"}', 1)
+        self.assertEqual(reopened.collect(), {'notey_requests_total{view="a"}': 3})
+
+
+class ProfileColorTest(ProjectTestCase):
+    def test_user_save_skips_profile(self):
+        with self.assertNumQueries(1):
+            self.user.save(update_fields=["last_login"])
+
+    def test_colors_are_cached(self):
+        ids = [author.id for author in self.authors]
+        Profile.objects.colors(ids)
+
+        with self.assertNumQueries(0):
+            colors = Profile.objects.colors(ids)
+        self.assertEqual(colors, dict.fromkeys(ids, DEFAULT_COLOR))
+
+        profile = self.authors[0].profile
+        profile.color = "#123456"
+        profile.save()
+        self.assertEqual(Profile.objects.colors(ids)[self.authors[0].id], "#123456")
+
+
+class SQLiteProfileTest(TestCase):
+    def test_pragmas_are_set(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_concurrent_writes_wait_for_the_lock(self):
+        out = StringIO()
+        call_command("benchmark_writes", processes=3, transactions=20, stdout=out)
+        self.assertRegex(out.getvalue(), r"configured: .*, 0 failed")
+
+
+class ReplicaRouterTest(TransactionTestCase):
+    def setUp(self):
+        isolate_caches(self)
+        self.user = User.objects.create_user("testuser", "test@example.com", "pass")
+        self.project = Project.objects.create(creator=self.user, name="Test project")
+        ProjectUser.objects.create(
+            project=self.project,
+            user=self.user,
+            permission=ProjectUserPermission.DELETE,
+        )
+        self.client.login(username="testuser", password="pass")
+        self.add_replica()
+        # Only on the primary from here on.
+        Note.objects.create(text="Not replicated", user=self.user, project=self.project)
+
+    def add_replica(self):
+        # A copy of the database, standing in for a replica that lags behind.
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        name = os.path.join(directory.name, "replica.sqlite3")
+        connection.ensure_connection()
+        with sqlite3.connect(name) as replica:
+            connection.connection.backup(replica)
+        replica.close()
+        connections["replica"] = load_backend(
+            connection.settings_dict["ENGINE"]
+        ).DatabaseWrapper({**connection.settings_dict, "NAME": name}, "replica")
+        self.addCleanup(connections["replica"].close)
+        settings_override = override_settings(DATABASE_REPLICAS=["replica"])
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_reads_go_to_replica_until_client_writes(self):
+        url = reverse("app:project_details", args=[self.project.id])
+        self.assertNotContains(self.client.get(url), "Not replicated")
+
+        response = self.client.post(
+            reverse("app:new_note", args=[self.project.id]), {"text": "New note"}
+        )
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        response = self.client.get(url)
+        self.assertContains(response, "New note")
+        self.assertContains(response, "Not replicated")
+
+        del self.client.cookies[PIN_COOKIE]
+        self.assertNotContains(self.client.get(url), "New note")
+
+    def test_memberships_are_read_from_primary(self):
+        # Revoked after the replica was copied.
+        ProjectUser.objects.filter(user=self.user).delete()
+
+        for name in ("project_details", "project_settings"):
+            response = self.client.get(reverse(f"app:{name}", args=[self.project.id]))
+            self.assertEqual(response.status_code, 404)
+
+    def test_reads_outside_requests_and_transactions_go_to_primary(self):
+        self.assertEqual(router.db_for_read(Note), "default")
+
+        token = replica_state.set(ReplicaState(pinned=False))
+        self.addCleanup(replica_state.reset, token)
+        self.assertEqual(router.db_for_read(Note), "replica")
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(Note), "default")
+
+
+class LoginTest(TestCase):
+    def setUp(self):
+        isolate_caches(self)
+        self.user = User.objects.create_user("testuser", "test@example.com", "pass")
+
+    def test_password_is_hashed_once(self):
+        with mock.patch.object(
+            PBKDF2PasswordHasher,
+            "verify",
+            autospec=True,
+            side_effect=PBKDF2PasswordHasher.verify,
+        ) as verify:
+            response = self.client.post(
+                reverse("app:login"), {"username": "testuser", "password": "pass"}
+            )
+        self.assertRedirects(response, reverse("app:home"))
+        self.assertEqual(verify.call_count, 1)
+
+    def test_failed_login_hashes_once(self):
+        with mock.patch.object(
+            PBKDF2PasswordHasher,
+            "verify",
+            autospec=True,
+            side_effect=PBKDF2PasswordHasher.verify,
+        ) as verify:
+            response = self.client.post(
+                reverse("app:login"), {"username": "testuser", "password": "wrong"}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(verify.call_count, 1)
+
+    def test_model_backend_sessions_are_migrated(self):
+        migration = importlib.import_module("app.migrations.0033_session_backend")
+        self.client.force_login(
+            self.user, backend="django.contrib.auth.backends.ModelBackend"
+        )
+
+        migration.switch_session_backend(apps, mock.Mock(connection=connection))
+
+        self.assertEqual(
+            self.client.session[BACKEND_SESSION_KEY], "app.auth.CachedModelBackend"
+        )
+        self.assertEqual(self.client.get(reverse("app:profile")).status_code, 200)
+
+    def test_password_is_rehashed_on_login(self):
+        with override_settings(PASSWORD_HASH_ITERATIONS=1000):
+            self.client.post(
+                reverse("app:login"), {"username": "testuser", "password": "pass"}
+            )
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("pbkdf2_sha256$1000$"))
+        self.assertTrue(self.user.check_password("pass"))
+
+
+class CachedUserTest(ProjectTestCase):
+    def test_deploy_check_needs_a_shared_cache(self):
+        self.assertEqual(
+            [message.id for message in check_shared_cache(None)], ["app.W001"]
+        )
+        redis = {"BACKEND": "django.core.cache.backends.redis.RedisCache"}
+        with override_settings(CACHES={"default": redis}):
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_user_is_invalidated_on_save(self):
+        url = reverse("app:profile")
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, "#FFFFFF")
+
+        profile = self.user.profile
+        profile.color = "#123456"
+        profile.save()
+        self.assertContains(self.client.get(url), "#123456")
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertRedirects(self.client.get(url), f"{reverse('app:login')}?next={url}")
+
+
+class ProjectSnapshotTest(ProjectTestCase):
+    def archive(self):
+        self.client.get(reverse("app:archive_project", args=[self.project.id]))
+
+    def test_archived_notes_are_served_from_snapshot(self):
+        self.add_notes(3)
+        attachment = Attachment.objects.filter(note__project=self.project).first()
+        self.archive()
+
+        self.assertFalse(self.project.get_notes().exists())
+        self.assertFalse(Attachment.objects.exists())
+        self.assertEqual(set(Blob.objects.values_list("ref_count", flat=True)), {1})
+        self.assertEqual(search.search_notes(self.user, "note", limit=10), [])
+
+        response = self.client.get(
+            reverse("app:archive_project_details", args=[self.project.id])
+        )
+        self.assertContains(response, "Note 2")
+        self.assertContains(response, "@author1")
+        self.assertContains(response, "0.txt")
+        response = self.client.get(
+            reverse("app:attachment_file", args=[self.project.id, attachment.id])
+        )
+        self.assertEqual(b"".join(response.streaming_content), b"Attachment 0")
+
+    def test_unarchive_restores_notes(self):
+        self.add_notes(3)
+        fields = ["id", "text", "user_id", "is_completed", "version", "created_at"]
+        notes = list(self.project.get_notes().order_by("id").values(*fields))
+        attachments = list(
+            Attachment.objects.order_by("id").values("id", "note_id", "blob_id")
+        )
+        self.archive()
+        self.authors[1].delete()
+
+        self.client.get(reverse("app:unarchive_project", args=[self.project.id]))
+
+        notes[1]["user_id"] = None
+        self.assertEqual(
+            list(self.project.get_notes().order_by("id").values(*fields)), notes
+        )
+        self.assertEqual(
+            list(Attachment.objects.order_by("id").values("id", "note_id", "blob_id")),
+            attachments,
+        )
+        self.assertFalse(ProjectSnapshot.objects.exists())
+        self.project.refresh_from_db()
+        self.assertFalse(self.project.is_archived)
+        self.assertEqual(len(search.search_notes(self.user, "note", limit=10)), 3)
+
+    def test_archiving_twice_keeps_one_snapshot(self):
+        self.add_notes(2)
+        self.archive()
+        snapshot = ProjectSnapshot.objects.get(project=self.project)
+
+        response = self.client.get(
+            reverse("app:archive_project", args=[self.project.id])
+        )
+
+        self.assertRedirects(response, reverse("app:projects"))
+        self.assertEqual(ProjectSnapshot.objects.compact(self.project), snapshot)
+        self.assertEqual(ProjectSnapshot.objects.count(), 1)
+
+    def test_archived_projects_reject_new_notes(self):
+        self.archive()
+
+        response = self.client.post(
+            reverse("app:new_note", args=[self.project.id]), {"text": "Late"}
+        )
+        self.assertEqual(response.status_code, 403)
+        _, key = ApiToken.objects.create_for(self.user)
+        response = self.client.post(
+            reverse("app:api_notes", args=[self.project.id]),
+            json.dumps({"notes": [{"text": "Late"}]}),
+            content_type="application/json",
+            HTTP_AUTHORIZATION=f"Bearer {key}",
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Note.objects.filter(project=self.project).exists())
+
+    def test_deleting_archived_project_releases_blobs(self):
+        self.add_notes(2)
+        self.archive()
+
+        self.project.delete()
+
+        self.assertFalse(Blob.objects.exists())
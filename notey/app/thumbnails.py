@@ -0,0 +1,41 @@
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+# Project cards are 18rem x 12rem.
+THUMBNAIL_SIZE = (288, 192)
+THUMBNAIL_SCALES = (1, 2)
+THUMBNAIL_FORMATS = {"webp": "WEBP", "jpg": "JPEG"}
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_DIR = "images/projects/thumbnails/"
+
+
+def thumbnail_name(image_name, scale, extension):
+    # The whole storage path, so images with the same base name in different
+    # directories or formats never share thumbnails.
+    width, height = THUMBNAIL_SIZE
+    return f"{THUMBNAIL_DIR}{image_name}-{width * scale}x{height * scale}.{extension}"
+
+
+def generate_thumbnails(image, force=False):
+    storage = image.storage
+    with image.open("rb"):
+        source = ImageOps.exif_transpose(Image.open(image)).convert("RGB")
+
+    for scale in THUMBNAIL_SCALES:
+        size = (THUMBNAIL_SIZE[0] * scale, THUMBNAIL_SIZE[1] * scale)
+        thumbnail = ImageOps.fit(source, size, Image.Resampling.LANCZOS)
+        for extension, format in THUMBNAIL_FORMATS.items():
+            name = thumbnail_name(image.name, scale, extension)
+            if storage.exists(name):
+                if not force:
+                    continue
+                storage.delete(name)
+            buffer = BytesIO()
+            thumbnail.save(buffer, format, quality=THUMBNAIL_QUALITY)
+            storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def has_thumbnails(image):
+    return image.storage.exists(thumbnail_name(image.name, 1, "jpg"))
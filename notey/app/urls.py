@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views
+from . import api, metrics, views
 
 app_name = "app"
 urlpatterns = [
@@ -10,6 +10,8 @@ urlpatterns = [
     path("logout", views.logout_request, name="logout"),
     path("projects", views.projects, name="projects"),
     path("archive", views.archive, name="archive"),
+    path("search", views.search, name="search"),
+    path("metrics", metrics.metrics, name="metrics"),
     path(
         "archive/<int:project_id>",
         views.archive_project_details,
@@ -21,7 +23,26 @@ urlpatterns = [
         "projects/delete/<int:project_id>", views.delete_project, name="delete_project"
     ),
     path("projects/<int:project_id>", views.project_details, name="project_details"),
+    path("projects/<int:project_id>/notes", views.project_notes, name="project_notes"),
     path("projects/<int:project_id>/new", views.new_note, name="new_note"),
+    path("projects/<int:project_id>/bulk", views.bulk_notes, name="bulk_notes"),
+    path("projects/<int:project_id>/events", views.note_events, name="note_events"),
+    path("projects/<int:project_id>/uploads", views.new_upload, name="new_upload"),
+    path(
+        "projects/<int:project_id>/attachments/<int:attachment_id>",
+        views.attachment_file,
+        name="attachment_file",
+    ),
+    path(
+        "projects/<int:project_id>/images/<path:name>",
+        views.project_image_file,
+        name="project_image_file",
+    ),
+    path(
+        "projects/<int:project_id>/uploads/<uuid:upload_id>",
+        views.upload_chunk,
+        name="upload",
+    ),
     path(
         "projects/<int:project_id>/delete/<int:note_id>",
         views.delete_note,
@@ -53,4 +74,26 @@ urlpatterns = [
         views.archive_project,
         name="archive_project",
     ),
+    path(
+        "projects/unarchive/<int:project_id>",
+        views.unarchive_project,
+        name="unarchive_project",
+    ),
+    path("api/projects", api.projects, name="api_projects"),
+    path(
+        "api/projects/<int:project_id>/members",
+        api.members,
+        name="api_members",
+    ),
+    path("api/projects/<int:project_id>/notes", api.notes, name="api_notes"),
+    path(
+        "api/projects/<int:project_id>/notes/complete",
+        api.complete_notes,
+        name="api_complete_notes",
+    ),
+    path(
+        "api/projects/<int:project_id>/notes/delete",
+        api.delete_notes,
+        name="api_delete_notes",
+    ),
 ]
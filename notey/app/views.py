@@ -1,27 +1,133 @@
-from django.contrib.auth import authenticate, login, logout
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth import login, logout
 from django.contrib.auth.forms import AuthenticationForm
-from django.contrib.auth.models import User
-from django.shortcuts import HttpResponseRedirect, redirect, render
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Count, Max
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse
+from django.shortcuts import HttpResponseRedirect, get_object_or_404, redirect, render
 from django.urls import reverse
+from django.views.decorators.http import require_http_methods, require_POST
 
+from .decorators import (
+    conditional_page,
+    login_required,
+    page_etag,
+    project_member_required,
+)
 from .forms import (
+    BulkNoteActionForm,
     NewNoteForm,
     NewProjectForm,
     NewProjectUser,
+    NewUploadForm,
     NewUserForm,
     ProfileUpdateForm,
     UpdateProjectForm,
     UserUpdateForm,
 )
+from .media import serve_file
 from .models import (
+    DEFAULT_COLOR,
     DEFAULT_PROJECT_IMAGE,
     Attachment,
     Note,
+    Profile,
     Project,
+    ProjectSnapshot,
     ProjectUser,
     ProjectUserPermission,
+    Upload,
 )
+from .search import search_notes
+from .thumbnails import THUMBNAIL_FORMATS, THUMBNAIL_SCALES, thumbnail_name
+
+PROJECTS_PER_PAGE = 48
+NOTES_PER_PAGE = 50
+SEARCH_RESULTS_PER_PAGE = 20
+
+
+def paginate_projects(request, projects):
+    paginator = Paginator(projects, PROJECTS_PER_PAGE)
+    return paginator.get_page(request.GET.get("page"))
+
+
+async def apaginate_projects(request, projects):
+    paginator = Paginator(projects, PROJECTS_PER_PAGE)
+    paginator.count = await projects.acount()
+    page = paginator.get_page(request.GET.get("page"))
+    page.object_list = [project async for project in page.object_list]
+    return page
+
+
+async def projects_etag(request, archived=False):
+    projects = Project.objects.visible_to(request.user, archived=archived)
+    marker = await projects.aaggregate(changed_at=Max("changed_at"), count=Count("id"))
+    etag = page_etag(request, archived, marker["count"], marker["changed_at"])
+    return etag, marker["changed_at"]
+
+
+async def archive_etag(request):
+    return await projects_etag(request, archived=True)
+
+
+async def project_etag(request, project_id):
+    changed_at = (
+        await Project.objects.filter(pk=project_id)
+        .values_list("changed_at", flat=True)
+        .aget()
+    )
+    etag = page_etag(request, project_id, request.project_user.permission, changed_at)
+    return etag, changed_at
+
+
+def note_feed(request, project):
+    before = request.GET.get("before")
+    before = int(before) if before and before.isdigit() else None
+    notes = project.get_notes().with_details().feed(before=before)
+    return notes[: NOTES_PER_PAGE + 1]
+
+
+def split_note_page(notes):
+    next_cursor = None
+    if len(notes) > NOTES_PER_PAGE:
+        notes = notes[:NOTES_PER_PAGE]
+        next_cursor = notes[-1].id
+    return notes, next_cursor
+
+
+def set_author_colors(notes, colors):
+    for note in notes:
+        note.author_color = colors.get(note.user_id, DEFAULT_COLOR)
+    return notes
+
+
+def with_author_colors(notes):
+    notes = list(notes)
+    colors = Profile.objects.colors(note.user_id for note in notes)
+    return set_author_colors(notes, colors)
+
+
+async def awith_author_colors(notes):
+    notes = [note async for note in notes]
+    colors = await Profile.objects.acolors(note.user_id for note in notes)
+    return set_author_colors(notes, colors)
+
+
+def paginate_notes(request, project):
+    return split_note_page(with_author_colors(note_feed(request, project)))
+
+
+async def apaginate_notes(request, project):
+    return split_note_page(await awith_author_colors(note_feed(request, project)))
+
+
+def upload_state(upload):
+    return {
+        "id": upload.id,
+        "url": reverse("app:upload", args=[upload.project_id, upload.id]),
+        "offset": upload.offset,
+        "size": upload.size,
+    }
 
 
 def home(request):
@@ -50,16 +156,10 @@ def login_request(request):
 
     if request.method == "POST":
         form = AuthenticationForm(request, data=request.POST)
+        # Validating the form authenticates the user, which hashes the password.
         if form.is_valid():
-            username, password = (
-                form.cleaned_data["username"],
-                form.cleaned_data["password"],
-            )
-            user = authenticate(username=username, password=password)
-
-            if user is not None:
-                login(request, user)
-                return redirect("app:home")
+            login(request, form.get_user())
+            return redirect("app:home")
     else:
         form = AuthenticationForm()
 
@@ -74,9 +174,10 @@ def logout_request(request):
 
 
 @login_required
-def projects(request):
+@conditional_page(projects_etag)
+async def projects(request):
     user = request.user
-    projects = ProjectUser.getProjects(user=user)
+    projects = await apaginate_projects(request, Project.objects.visible_to(user))
     new_project_form = NewProjectForm()
     context = {
         "projects": projects,
@@ -106,7 +207,7 @@ def new_project(request):
             form_errors = False
     else:
         form = NewProjectForm()
-    projects = ProjectUser.getProjects(user=user)
+    projects = paginate_projects(request, Project.objects.visible_to(user))
     form_errors = True
     context = {
         "projects": projects,
@@ -116,32 +217,69 @@ def new_project(request):
     return render(request, "app/projects.html", context)
 
 
+@project_member_required
 def delete_project(request, project_id):
-    project = Project.objects.get(pk=project_id)
+    project = request.project
     project.delete()
     return HttpResponseRedirect(reverse("app:projects"))
 
 
-def project_details(request, project_id):
-    user = request.user
-    project = Project.objects.get(pk=project_id)
-    project_user = ProjectUser.objects.get(user=user, project=project)
-    notes = project.get_notes()
+@project_member_required
+@conditional_page(project_etag)
+async def project_details(request, project_id):
+    project = request.project
+    project_user = request.project_user
+    notes, next_cursor = await apaginate_notes(request, project)
     note_form = NewNoteForm()
     context = {
         "project": project,
         "project_user": project_user,
         "notes": notes,
+        "next_cursor": next_cursor,
         "form": note_form,
     }
     return render(request, "app/project_details.html", context)
 
 
+@project_member_required
+def project_notes(request, project_id):
+    project = request.project
+    project_user = request.project_user
+    ids = request.GET.get("ids", "").split(",")
+    if all(note_id.isdigit() for note_id in ids):
+        # Cards re-rendered after live note events.
+        notes = project.get_notes().with_details().filter(id__in=ids).feed()
+        notes, next_cursor = with_author_colors(notes[:NOTES_PER_PAGE]), None
+    else:
+        notes, next_cursor = paginate_notes(request, project)
+    context = {
+        "project": project,
+        "project_user": project_user,
+        "notes": notes,
+        "next_cursor": next_cursor,
+    }
+    return render(request, "includes/note_page.html", context)
+
+
+@project_member_required
+def note_events(request, project_id):
+    # Event streams are served by app.streams under ASGI. Status 204 tells
+    # clients of a WSGI deployment not to reconnect.
+    return HttpResponse(status=204)
+
+
+@project_member_required
 def new_note(request, project_id):
     user = request.user
-    project = Project.objects.get(pk=project_id)
+    project = request.project
     if request.method == "POST":
+        # Archived projects only show the notes of their snapshot.
+        if project.is_archived:
+            return HttpResponseForbidden()
         form = NewNoteForm(request.POST, request.FILES)
+        form.fields["upload"].queryset = Upload.objects.complete().filter(
+            user=user, project=project
+        )
         if form.is_valid():
             note = Note(
                 text=form.cleaned_data["text"],
@@ -153,7 +291,10 @@ def new_note(request, project_id):
 
             attachments = request.FILES.getlist("attachment")
             for attachment in attachments:
-                Attachment.objects.create(note=note, file=attachment).save()
+                Attachment.objects.create_from_file(note, attachment)
+
+            for upload in form.cleaned_data["upload"]:
+                upload.attach_to(note)
 
             return HttpResponseRedirect(
                 reverse("app:project_details", args=[project_id])
@@ -161,48 +302,137 @@ def new_note(request, project_id):
     else:
         form = NewNoteForm()
 
-    notes = project.get_notes()
+    notes, next_cursor = paginate_notes(request, project)
     context = {
         "project": project,
+        "project_user": request.project_user,
         "notes": notes,
+        "next_cursor": next_cursor,
+        "form": form,
     }
     return render(request, "app/project_details.html", context)
 
 
+@require_POST
+@project_member_required
+def bulk_notes(request, project_id):
+    form = BulkNoteActionForm(request.POST)
+    if form.is_valid():
+        notes = request.project.get_notes().filter(id__in=form.cleaned_data["notes"])
+        action = form.cleaned_data["action"]
+        if action == "delete":
+            notes.permitted(request.user, "D").delete_in_bulk()
+        else:
+            notes.permitted(request.user, "C").set_completed(action == "complete")
+    return HttpResponseRedirect(reverse("app:project_details", args=[project_id]))
+
+
+@require_POST
+@project_member_required
+def new_upload(request, project_id):
+    if not request.project_user.can_write or request.project.is_archived:
+        return HttpResponseForbidden()
+
+    form = NewUploadForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({"errors": form.errors}, status=400)
+
+    upload = form.save(commit=False)
+    upload.user = request.user
+    upload.project = request.project
+    upload.save()
+    return JsonResponse(upload_state(upload), status=201)
+
+
+@require_http_methods(["GET", "PATCH"])
+@project_member_required
+def upload_chunk(request, project_id, upload_id):
+    upload = get_object_or_404(
+        Upload, pk=upload_id, user=request.user, project=request.project
+    )
+
+    if request.method == "PATCH":
+        offset = request.headers.get("Upload-Offset")
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+        if offset != str(upload.offset):
+            return JsonResponse(upload_state(upload), status=409)
+        if length > upload.size - upload.offset:
+            return JsonResponse(upload_state(upload), status=413)
+        if not upload.write_chunk(request, upload.offset, length):
+            return JsonResponse(upload_state(upload), status=409)
+
+    return JsonResponse(upload_state(upload))
+
+
+@project_member_required
+def attachment_file(request, project_id, attachment_id):
+    project = request.project
+    snapshot = None
+    if project.is_archived:
+        snapshot = ProjectSnapshot.objects.filter(project=project).first()
+    if snapshot is None:
+        attachment = get_object_or_404(
+            Attachment.objects.select_related("blob"),
+            pk=attachment_id,
+            note__project=project,
+        )
+    else:
+        attachment = snapshot.get_attachment(attachment_id)
+        if attachment is None:
+            raise Http404("Attachment not found.")
+    return serve_file(
+        request,
+        attachment.file.storage,
+        attachment.file.name,
+        etag=attachment.blob_id,
+        filename=attachment.name,
+        immutable=True,
+    )
+
+
+@project_member_required
+def project_image_file(request, project_id, name):
+    image = request.project.image
+    renditions = [image.name] + [
+        thumbnail_name(image.name, scale, extension)
+        for scale in THUMBNAIL_SCALES
+        for extension in THUMBNAIL_FORMATS
+    ]
+    if name not in renditions:
+        raise Http404("Image not found.")
+    # Renditions are stored under new names whenever the image changes.
+    return serve_file(request, image.storage, name, immutable=True)
+
+
+@project_member_required
 def delete_note(request, project_id, note_id):
-    note = Note.objects.get(pk=note_id)
+    note = Note.objects.get(pk=note_id, project=request.project)
     note.delete()
     return HttpResponseRedirect(reverse("app:project_details", args=[project_id]))
 
 
+@project_member_required
 def complete_note(request, project_id, note_id):
-    note = Note.objects.get(pk=note_id)
+    note = Note.objects.get(pk=note_id, project=request.project)
     note.is_completed = not (note.is_completed)
     note.save()
     return HttpResponseRedirect(reverse("app:project_details", args=[project_id]))
 
 
+@project_member_required
 def project_settings(request, project_id):
     user = request.user
-    project = Project.objects.get(pk=project_id)
+    project = request.project
     users = project.get_users()
-    notes = project.get_notes()
-    is_archiveable = True
-
-    for note in notes:
-        if not note.is_completed:
-            is_archiveable = False
-            break
-
-    if len(notes) == 0:
-        is_archiveable = False
+    project.refresh_counters()
 
     if request.method == "POST":
         form = UpdateProjectForm(request.POST, request.FILES, instance=project)
         if form.is_valid():
-            form.save()
+            form.save(commit=False)
             project.image = form.cleaned_data.get("image")
-            project.save()
+            # The counters may have changed since they were read above.
+            project.save(update_fields=["name", "image", "updated_at", "changed_at"])
             return HttpResponseRedirect(
                 reverse("app:project_settings", args=[project_id])
             )
@@ -217,22 +447,17 @@ def project_settings(request, project_id):
         "form": form,
         "add_user_form": add_user_form,
         "users": users,
-        "is_archiveable": is_archiveable,
+        "is_archiveable": project.is_archiveable,
     }
     return render(request, "app/project_settings.html", context)
 
 
+@project_member_required
 def add_user(request, project_id):
     user = request.user
-    project = Project.objects.get(pk=project_id)
+    project = request.project
     users = project.get_users()
-    notes = project.get_notes()
-    is_archiveable = True
-
-    for note in notes:
-        if not note.is_completed:
-            is_archiveable = False
-            break
+    project.refresh_counters()
 
     if request.method == "POST":
         add_user_form = NewProjectUser(request.POST, initial={"project": project})
@@ -253,24 +478,21 @@ def add_user(request, project_id):
         "form": form,
         "add_user_form": add_user_form,
         "users": users,
-        "is_archiveable": is_archiveable,
+        "is_archiveable": project.is_archiveable,
     }
     return render(request, "app/project_settings.html", context)
 
 
+@project_member_required
 def remove_user(request, project_id, user_id):
-    project = Project.objects.get(pk=project_id)
-    user = User.objects.get(pk=user_id)
-    project_user = ProjectUser.objects.get(project=project, user=user)
+    project_user = ProjectUser.objects.get(project=request.project, user_id=user_id)
     project_user.delete()
     return HttpResponseRedirect(reverse("app:project_settings", args=[project_id]))
 
 
+@project_member_required
 def leave_project(request, project_id):
-    project = Project.objects.get(pk=project_id)
-    user = request.user
-    project_user = ProjectUser.objects.get(project=project, user=user)
-    project_user.delete()
+    request.project_user.delete()
     return HttpResponseRedirect(reverse("app:projects"))
 
 
@@ -283,8 +505,9 @@ def profile(request):
         form = ProfileUpdateForm(request.POST)
         if user_form.is_valid() and form.is_valid():
             user_form.save()
-            profile.color = form.cleaned_data["color"]
-            profile.save()
+            if profile.color != form.cleaned_data["color"]:
+                profile.color = form.cleaned_data["color"]
+                profile.save(update_fields=["color"])
             return HttpResponseRedirect(reverse("app:profile"))
     else:
         user_form = UserUpdateForm(instance=request.user)
@@ -299,21 +522,54 @@ def profile(request):
     return render(request, "app/profile.html", context)
 
 
-def archive(request):
+@login_required
+def search(request):
+    query = request.GET.get("q", "").strip()
+    page = request.GET.get("page", "1")
+    page = int(page) if page.isdigit() and int(page) > 0 else 1
+    results = search_notes(
+        request.user,
+        query,
+        limit=SEARCH_RESULTS_PER_PAGE + 1,
+        offset=(page - 1) * SEARCH_RESULTS_PER_PAGE,
+    )
+    context = {
+        "query": query,
+        "results": results[:SEARCH_RESULTS_PER_PAGE],
+        "page": page,
+        "has_next": len(results) > SEARCH_RESULTS_PER_PAGE,
+    }
+    return render(request, "app/search.html", context)
+
+
+@login_required
+@conditional_page(archive_etag)
+async def archive(request):
     user = request.user
-    projects = ProjectUser.getArchivedProjects(user=user)
-    print("Aaaaaa", len(projects))
+    projects = await apaginate_projects(
+        request, Project.objects.visible_to(user, archived=True)
+    )
     context = {
         "projects": projects,
     }
     return render(request, "app/archive.html", context)
 
 
-def archive_project_details(request, project_id):
-    user = request.user
-    project = Project.objects.get(pk=project_id)
-    project_user = ProjectUser.objects.get(user=user, project=project)
-    notes = project.get_notes()
+@project_member_required
+async def archive_project_details(request, project_id):
+    project = request.project
+    project_user = request.project_user
+    snapshot = await ProjectSnapshot.objects.filter(project=project).afirst()
+    if snapshot is None:
+        # Archived before snapshots existed, see compact_archived_projects.
+        notes = await awith_author_colors(project.get_notes().with_details())
+        for note in notes:
+            note.attachments = note.get_attachments()
+    else:
+        notes = snapshot.get_notes()
+        set_author_colors(
+            notes, await Profile.objects.acolors(note.user_id for note in notes)
+        )
     note_form = NewNoteForm()
     context = {
         "project": project,
@@ -324,8 +580,24 @@ def archive_project_details(request, project_id):
     return render(request, "app/archive_project_details.html", context)
 
 
+@project_member_required
 def archive_project(request, project_id):
-    project = Project.objects.get(pk=project_id)
-    project.is_archived = True
-    project.save()
+    project = request.project
+    if project.is_archived:
+        return HttpResponseRedirect(reverse("app:projects"))
+    with transaction.atomic():
+        project.is_archived = True
+        # The cached project may hold stale counters, so only write what changed.
+        project.save(update_fields=["is_archived", "updated_at", "changed_at"])
+        ProjectSnapshot.objects.compact(project)
     return HttpResponseRedirect(reverse("app:projects"))
+
+
+@project_member_required
+def unarchive_project(request, project_id):
+    project = request.project
+    with transaction.atomic():
+        ProjectSnapshot.objects.restore(project)
+        project.is_archived = False
+        project.save(update_fields=["is_archived", "updated_at", "changed_at"])
+    return HttpResponseRedirect(reverse("app:project_details", args=[project_id]))
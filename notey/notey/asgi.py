@@ -13,4 +13,8 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "notey.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from app.streams import NoteEventStream  # noqa: E402
+
+application = NoteEventStream(django_application)
@@ -44,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "app.metrics.metrics_middleware",
+    "app.replicas.replica_middleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -57,7 +59,7 @@ ROOT_URLCONF = "notey.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "BACKEND": "app.metrics.DjangoTemplates",
         "DIRS": [],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -77,20 +79,64 @@ WSGI_APPLICATION = "notey.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# WAL lets readers run alongside the writer, and busy_timeout makes writers
+# wait for the lock rather than fail. Write transactions take the lock at
+# BEGIN (see app.backends.sqlite3). Connections are kept between requests for
+# DB_CONN_MAX_AGE seconds.
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
+        "ENGINE": "app.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", 600)),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "transaction_mode": "IMMEDIATE",
+            "pragmas": {
+                "journal_mode": "WAL",
+                "synchronous": "NORMAL",
+                "busy_timeout": 5000,
+                "mmap_size": 128 * 1024 * 1024,
+                "cache_size": -20000,
+            },
+        },
     }
 }
 
 
+# Read replicas
+# DB_REPLICAS lists copies of the database file, kept up to date outside the
+# app. Requests that have not written read from them, unless the same client
+# wrote within the last REPLICA_PIN_SECONDS, which must cover the replication
+# lag (see app.replicas).
+
+DATABASE_REPLICAS = []
+for i, name in enumerate(filter(None, os.environ.get("DB_REPLICAS", "").split(","))):
+    alias = f"replica{i}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "NAME": name,
+        "OPTIONS": {
+            **DATABASES["default"]["OPTIONS"],
+            "pragmas": {**DATABASES["default"]["OPTIONS"]["pragmas"], "query_only": 1},
+        },
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["app.replicas.ReplicaRouter"]
+REPLICA_PIN_SECONDS = 5
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
 AUTH_PASSWORD_VALIDATORS = [
     {
-        "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
+        "NAME": (
+            "django.contrib.auth.password_validation."
+            "UserAttributeSimilarityValidator"
+        ),
     },
     {
         "NAME": "django.contrib.auth.password_validation.MinimumLengthValidator",
@@ -104,6 +150,21 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing
+# Each login costs one hash of PASSWORD_HASH_ITERATIONS iterations; measure it
+# with the benchmark_logins command. Existing hashes are upgraded to a new
+# count as their users log in.
+
+PASSWORD_HASHERS = [
+    "app.hashers.PBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "django.contrib.auth.hashers.Argon2PasswordHasher",
+    "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+    "django.contrib.auth.hashers.ScryptPasswordHasher",
+]
+PASSWORD_HASH_ITERATIONS = int(os.environ.get("PASSWORD_HASH_ITERATIONS", 390000))
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.1/topics/i18n/
 
@@ -123,6 +184,31 @@ STATIC_URL = "static/"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Media serving
+# Set to "X-Accel-Redirect" (nginx) or "X-Sendfile" (Apache, lighttpd) to let
+# the front server transfer files after the app has checked access.
+
+MEDIA_SENDFILE_HEADER = None
+MEDIA_ACCEL_PREFIX = "/protected-media/"
+
+# Live note updates
+# The broker fans note events out to open event streams. The local broker only
+# reaches streams served by the same process.
+
+NOTE_EVENT_BROKER = "app.events.LocalBroker"
+
+# Metrics
+# With several worker processes, each writes its metrics to a file in
+# METRICS_DIR, which must be shared by all workers and emptied on deploy.
+# Without it, /metrics only reports the process that serves the scrape.
+# Scrapes must send METRICS_TOKEN as a bearer token. Without a token, only
+# METRICS_ALLOWED_IPS may scrape, and a reverse proxy on the same host must
+# block /metrics, as every request it forwards comes from its address.
+
+METRICS_DIR = os.environ.get("METRICS_DIR")
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+METRICS_ALLOWED_IPS = ["127.0.0.1", "::1"]
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
@@ -137,3 +223,35 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 # @login_required
 
 LOGIN_URL = "app:login"
+
+# Cache
+# Sessions, request users, project memberships and profile colours are
+# cached and invalidated through the default cache, so with several worker
+# processes it must be shared by all of them: set REDIS_URL to a Redis server
+# (with the redis package). The local-memory fallback is only correct for a
+# single process, and "check --deploy" warns about it.
+# Note cards are cached under keys that change with the note, so they never
+# need invalidating and stay in each process's memory.
+
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "fragments": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "fragments",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+if os.environ.get("REDIS_URL"):
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ["REDIS_URL"],
+    }
+
+# Sessions and authentication
+# Sessions and the user of each request (with their profile) are read from the
+# cache, so that pages don't start with two queries. Sessions started with
+# ModelBackend are moved to the cached backend by a migration.
+
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+
+AUTHENTICATION_BACKENDS = ["app.auth.CachedModelBackend"]